@@ -0,0 +1,30 @@
+"""Add popular sort indexes for agent and user filters
+
+Revision ID: 3f6d1a9e8b42
+Revises: 9c4e7b2a6d15
+Create Date: 2026-10-17 16:40:12.308514
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f6d1a9e8b42'
+down_revision: Union[str, Sequence[str], None] = '9c4e7b2a6d15'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_fixed_points_character_id_favorites_count_id', 'fixed_points', ['character_id', 'favorites_count', 'id'], unique=False)
+    op.create_index('ix_fixed_points_user_id_favorites_count_id', 'fixed_points', ['user_id', 'favorites_count', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_fixed_points_user_id_favorites_count_id', table_name='fixed_points')
+    op.drop_index('ix_fixed_points_character_id_favorites_count_id', table_name='fixed_points')
@@ -0,0 +1,28 @@
+"""Add keyset pagination index to fixed_points
+
+Revision ID: 7d2e9a4b1c3f
+Revises: 41c7562bec15
+Create Date: 2026-10-17 09:12:41.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7d2e9a4b1c3f'
+down_revision: Union[str, Sequence[str], None] = '41c7562bec15'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_fixed_points_created_at_id', 'fixed_points', ['created_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_fixed_points_created_at_id', table_name='fixed_points')
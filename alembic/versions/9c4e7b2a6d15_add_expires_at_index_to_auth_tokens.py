@@ -0,0 +1,28 @@
+"""Add expires_at index to auth_tokens
+
+Revision ID: 9c4e7b2a6d15
+Revises: e5a0c2d8f917
+Create Date: 2026-10-17 14:02:41.518203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c4e7b2a6d15'
+down_revision: Union[str, Sequence[str], None] = 'e5a0c2d8f917'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_auth_tokens_expires_at', 'auth_tokens', ['expires_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_auth_tokens_expires_at', table_name='auth_tokens')
@@ -0,0 +1,43 @@
+"""Add favorites_count to fixed_points
+
+Revision ID: b3f81c6e05d2
+Revises: 7d2e9a4b1c3f
+Create Date: 2026-10-17 10:04:18.552910
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3f81c6e05d2'
+down_revision: Union[str, Sequence[str], None] = '7d2e9a4b1c3f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('fixed_points', sa.Column('favorites_count', sa.Integer(), server_default='0', nullable=False))
+    # 既存のお気に入りから件数をバックフィル
+    op.execute(
+        """
+        UPDATE fixed_points
+        SET favorites_count = counts.cnt
+        FROM (
+            SELECT fixed_point_id, COUNT(*) AS cnt
+            FROM favorites
+            GROUP BY fixed_point_id
+        ) AS counts
+        WHERE fixed_points.id = counts.fixed_point_id
+        """
+    )
+    op.create_index('ix_fixed_points_favorites_count_id', 'fixed_points', ['favorites_count', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_fixed_points_favorites_count_id', table_name='fixed_points')
+    op.drop_column('fixed_points', 'favorites_count')
@@ -0,0 +1,49 @@
+"""Add composite indexes for fixed point queries
+
+Revision ID: e5a0c2d8f917
+Revises: b3f81c6e05d2
+Create Date: 2026-10-17 11:27:53.094716
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5a0c2d8f917'
+down_revision: Union[str, Sequence[str], None] = 'b3f81c6e05d2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_fixed_points_map_id_character_id_created_at_id', 'fixed_points', ['map_id', 'character_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_fixed_points_map_id_created_at_id', 'fixed_points', ['map_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_fixed_points_character_id_created_at_id', 'fixed_points', ['character_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_fixed_points_user_id_created_at_id', 'fixed_points', ['user_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_fixed_points_map_id_character_id_favorites_count_id', 'fixed_points', ['map_id', 'character_id', 'favorites_count', 'id'], unique=False)
+    op.create_index('ix_fixed_points_map_id_favorites_count_id', 'fixed_points', ['map_id', 'favorites_count', 'id'], unique=False)
+    # 上記の複合インデックスの先頭列でカバーされるため削除
+    op.drop_index(op.f('ix_fixed_points_map_id'), table_name='fixed_points')
+    op.drop_index(op.f('ix_fixed_points_character_id'), table_name='fixed_points')
+    op.create_index('ix_favorites_fixed_point_id', 'favorites', ['fixed_point_id'], unique=False)
+    op.create_index('ix_favorites_user_id_created_at', 'favorites', ['user_id', 'created_at'], unique=False)
+    op.create_index('ix_fixed_point_steps_fixed_point_id_step_order', 'fixed_point_steps', ['fixed_point_id', 'step_order'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_fixed_point_steps_fixed_point_id_step_order', table_name='fixed_point_steps')
+    op.drop_index('ix_favorites_user_id_created_at', table_name='favorites')
+    op.drop_index('ix_favorites_fixed_point_id', table_name='favorites')
+    op.create_index(op.f('ix_fixed_points_character_id'), 'fixed_points', ['character_id'], unique=False)
+    op.create_index(op.f('ix_fixed_points_map_id'), 'fixed_points', ['map_id'], unique=False)
+    op.drop_index('ix_fixed_points_map_id_favorites_count_id', table_name='fixed_points')
+    op.drop_index('ix_fixed_points_map_id_character_id_favorites_count_id', table_name='fixed_points')
+    op.drop_index('ix_fixed_points_user_id_created_at_id', table_name='fixed_points')
+    op.drop_index('ix_fixed_points_character_id_created_at_id', table_name='fixed_points')
+    op.drop_index('ix_fixed_points_map_id_created_at_id', table_name='fixed_points')
+    op.drop_index('ix_fixed_points_map_id_character_id_created_at_id', table_name='fixed_points')
@@ -1,43 +1,58 @@
 """認証API"""
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from core.database import get_db
+from core.database import get_async_db
 from core.security import get_current_user
-from schemas.auth import UserRegister, UserLogin, Token, UserResponse
-from services.auth import AuthService
+from schemas.auth import UserRegister, UserLogin, Token, UserResponse, RefreshTokenRequest
+from services.auth import AuthService, PasswordHashingBusyError
 from models.user import User
 
 router = APIRouter(prefix="/api/auth", tags=["auth"])
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
 
+def password_hashing_busy() -> HTTPException:
+    """パスワードハッシュのワーカーが埋まっている場合のレスポンス"""
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many authentication requests, please retry later",
+        headers={"Retry-After": "1"},
+    )
+
+
 @router.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-async def register(user_data: UserRegister, db: Session = Depends(get_db)):
+async def register(user_data: UserRegister, db: AsyncSession = Depends(get_async_db)):
     """新規ユーザー登録"""
     # ユーザーの重複チェック
-    if AuthService.user_exists(db, user_data.username, user_data.email):
+    if await AuthService.user_exists(db, user_data.username, user_data.email):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Username or email already registered"
         )
     
     # ユーザー作成
-    user = AuthService.create_user(
-        db=db,
-        username=user_data.username,
-        email=user_data.email,
-        password=user_data.password
-    )
+    try:
+        user = await AuthService.create_user(
+            db=db,
+            username=user_data.username,
+            email=user_data.email,
+            password=user_data.password
+        )
+    except PasswordHashingBusyError:
+        raise password_hashing_busy()
     
     return user
 
 
 @router.post("/login", response_model=Token)
-async def login(user_data: UserLogin, db: Session = Depends(get_db)):
+async def login(user_data: UserLogin, db: AsyncSession = Depends(get_async_db)):
     """ログイン"""
-    user = AuthService.authenticate_user(db, user_data.email, user_data.password)
+    try:
+        user = await AuthService.authenticate_user(db, user_data.email, user_data.password)
+    except PasswordHashingBusyError:
+        raise password_hashing_busy()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -45,28 +60,20 @@ async def login(user_data: UserLogin, db: Session = Depends(get_db)):
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    # トークン作成
-    token_data = {
-        "user_id": user.id,
-        "username": user.username,
-        "email": user.email
-    }
-    access_token = AuthService.create_access_token(token_data)
-    refresh_token = AuthService.create_refresh_token(token_data)
-    
-    return Token(
-        access_token=access_token,
-        refresh_token=refresh_token
-    )
+    # トークン作成（リフレッシュトークンはハッシュをDBに保存）
+    return await AuthService.issue_tokens(db, user)
 
 
 @router.post("/login/form", response_model=Token)
 async def login_form(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """フォームベースのログイン（OAuth2互換）"""
-    user = AuthService.authenticate_user(db, form_data.username, form_data.password)
+    try:
+        user = await AuthService.authenticate_user(db, form_data.username, form_data.password)
+    except PasswordHashingBusyError:
+        raise password_hashing_busy()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -74,19 +81,24 @@ async def login_form(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    # トークン作成
-    token_data = {
-        "user_id": user.id,
-        "username": user.username,
-        "email": user.email
-    }
-    access_token = AuthService.create_access_token(token_data)
-    refresh_token = AuthService.create_refresh_token(token_data)
+    # トークン作成（リフレッシュトークンはハッシュをDBに保存）
+    return await AuthService.issue_tokens(db, user)
+
+
+@router.post("/refresh", response_model=Token)
+async def refresh_tokens(request_data: RefreshTokenRequest, db: AsyncSession = Depends(get_async_db)):
+    """リフレッシュトークンで新しいトークンを発行
     
-    return Token(
-        access_token=access_token,
-        refresh_token=refresh_token
-    )
+    使用したリフレッシュトークンは無効になり、新しいリフレッシュトークンが返る（ローテーション）。
+    """
+    tokens = await AuthService.rotate_refresh_token(db, request_data.refresh_token)
+    if tokens is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return tokens
 
 
 @router.get("/me", response_model=UserResponse)
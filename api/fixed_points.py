@@ -1,29 +1,160 @@
 """定点API"""
-from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func, and_
+import base64
+import hashlib
+import json
+from datetime import datetime
+from typing import List, Literal, Optional, Sequence, Set, Tuple, Union
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from sqlalchemy import Select, select, and_, exists, false, func, tuple_
 
-from core.database import get_db
-from core.security import get_current_user
+from core.database import get_async_db
+from core.http_cache import etag_matches
+from core.security import get_current_user, get_optional_user_claims
 from schemas.fixed_point import (
     FixedPointCreate, 
     FixedPointUpdate, 
     FixedPointResponse, 
-    FixedPointListResponse
+    FixedPointListResponse,
+    FixedPointImportResponse
 )
+from schemas.auth import TokenData
 from models.user import User
 from models.fixed_point import FixedPoint, FixedPointStep
 from models.favorite import Favorite
+from services.fixed_point_cache import (
+    fixed_point_list_cache,
+    FixedPointListKey,
+    FixedPointListPage
+)
+from services.fixed_point_import import import_fixed_points
 
 router = APIRouter(prefix="/api/fixed-points", tags=["fixed-points"])
 
+# 次ページのカーソルを返すレスポンスヘッダー
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+# 詳細はユーザーごとに is_favorited が異なるため、共有キャッシュには保存させず毎回ETagで再検証させる
+DETAIL_CACHE_CONTROL = "private, no-cache"
+
+
+def get_sort_columns(sort: str) -> tuple:
+    """並び順ごとのキーセット列 (ソートキー, id)"""
+    if sort == "popular":
+        return FixedPoint.favorites_count, FixedPoint.id
+    return FixedPoint.created_at, FixedPoint.id
+
+
+def encode_cursor(sort: str, sort_value: Union[datetime, int], fixed_point_id: int) -> str:
+    """(ソートキー, id) から不透明なカーソル文字列を生成"""
+    if isinstance(sort_value, datetime):
+        sort_value = sort_value.isoformat()
+    payload = json.dumps({"s": sort, "v": sort_value, "i": fixed_point_id})
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str) -> Tuple[Union[datetime, int], int]:
+    """カーソル文字列を (ソートキー, id) に復元"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if payload["s"] != sort:
+            raise ValueError("cursor was issued for a different sort order")
+        if sort == "popular":
+            return int(payload["v"]), int(payload["i"])
+        return datetime.fromisoformat(payload["v"]), int(payload["i"])
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+
+def build_fixed_point_list_query(
+    character_id: Optional[str] = None,
+    map_id: Optional[str] = None,
+    user_id: Optional[int] = None,
+    favorited_by: Optional[int] = None,
+    sort: str = "newest",
+    after: Optional[Tuple[Union[datetime, int], int]] = None
+) -> Select:
+    """定点一覧のクエリを構築（ユーザーごとのお気に入り状態は build_favorited_ids_query で別途取得する）
+    
+    after には直前のページの最後の行の (ソートキー, id) を渡す。
+    """
+    query = select(
+        FixedPoint.id,
+        FixedPoint.user_id,
+        FixedPoint.title,
+        FixedPoint.character_id,
+        FixedPoint.map_id,
+        FixedPoint.created_at,
+        FixedPoint.favorites_count,
+        User.username
+    ).select_from(FixedPoint).join(
+        User, User.id == FixedPoint.user_id
+    )
+    
+    # フィルタ適用
+    if character_id:
+        query = query.where(FixedPoint.character_id == character_id)
+    if map_id:
+        query = query.where(FixedPoint.map_id == map_id)
+    if user_id:
+        query = query.where(FixedPoint.user_id == user_id)
+    if favorited_by:
+        query = query.where(
+            exists().where(
+                and_(
+                    Favorite.fixed_point_id == FixedPoint.id,
+                    Favorite.user_id == favorited_by
+                )
+            )
+        )
+    
+    sort_column, id_column = get_sort_columns(sort)
+    if after is not None:
+        cursor_value, cursor_id = after
+        query = query.where(
+            tuple_(sort_column, id_column) < tuple_(cursor_value, cursor_id)
+        )
+    
+    # 並び替え
+    query = query.order_by(sort_column.desc(), id_column.desc())
+    
+    return query
+
+
+def build_favorited_ids_query(user_id: int, fixed_point_ids: Sequence[int]) -> Select:
+    """指定した定点のうち、ユーザーがお気に入りしているもののIDを取得するクエリ"""
+    return select(Favorite.fixed_point_id).where(
+        Favorite.user_id == user_id,
+        Favorite.fixed_point_id.in_(fixed_point_ids)
+    )
+
+
+async def get_favorited_ids(db: AsyncSession, user_id: int, fixed_point_ids: Sequence[int]) -> Set[int]:
+    """ページ内の定点のお気に入り状態を1つのクエリでまとめて取得"""
+    if not fixed_point_ids:
+        return set()
+    return set((await db.scalars(build_favorited_ids_query(user_id, fixed_point_ids))).all())
+
+
+async def get_fixed_point_with_steps(db: AsyncSession, fixed_point_id: int) -> Optional[FixedPoint]:
+    """ステップを含めて定点を取得（非同期セッションでは遅延ロードできないため明示的にロード）"""
+    result = await db.execute(
+        select(FixedPoint).options(
+            selectinload(FixedPoint.steps)
+        ).where(FixedPoint.id == fixed_point_id).execution_options(populate_existing=True)
+    )
+    return result.scalar_one_or_none()
+
 
 @router.post("/", response_model=FixedPointResponse, status_code=status.HTTP_201_CREATED)
 async def create_fixed_point(
     fixed_point_data: FixedPointCreate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """定点を作成"""
     # 定点を作成
@@ -34,7 +165,7 @@ async def create_fixed_point(
         map_id=fixed_point_data.map_id
     )
     db.add(fixed_point)
-    db.flush()  # IDを取得するためにflush
+    await db.flush()  # IDを取得するためにflush
     
     # ステップを作成
     for step_data in fixed_point_data.steps:
@@ -50,134 +181,265 @@ async def create_fixed_point(
         )
         db.add(step)
     
-    db.commit()
-    db.refresh(fixed_point)
+    await db.commit()
+    
+    # 新しい定点が含まれる一覧のキャッシュを削除
+    fixed_point_list_cache.invalidate(
+        map_id=fixed_point.map_id,
+        character_id=fixed_point.character_id,
+        user_id=fixed_point.user_id
+    )
+    
+    # サーバー側で設定された値とステップを再取得
+    fixed_point = await get_fixed_point_with_steps(db, fixed_point.id)
     
     # レスポンス用にお気に入り情報を追加
     response = FixedPointResponse.model_validate(fixed_point)
-    response.favorites_count = 0
     response.is_favorited = False
     
     return response
 
 
+@router.post("/import", response_model=FixedPointImportResponse)
+async def import_fixed_points_ndjson(
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """定点を一括登録（リクエストボディは1行に1件の定点を書いたNDJSON）
+    
+    ボディはストリームのまま読み込み、チャンクごとにまとめて登録する。
+    不正な行はスキップし、行番号とエラー内容をレスポンスで返す。
+    """
+    return await import_fixed_points(db, current_user.id, request.stream())
+
+
 @router.get("/", response_model=List[FixedPointListResponse])
 async def get_fixed_points(
+    response: Response,
     character_id: Optional[str] = Query(None, description="エージェントIDでフィルタ"),
     map_id: Optional[str] = Query(None, description="マップIDでフィルタ"),
     user_id: Optional[int] = Query(None, description="ユーザーIDでフィルタ"),
     favorited_by: Optional[int] = Query(None, description="お気に入りしたユーザーIDでフィルタ"),
-    skip: int = Query(0, ge=0),
+    sort: Literal["newest", "popular"] = Query("newest", description="並び順（newest: 新着順, popular: お気に入り数順）"),
+    cursor: Optional[str] = Query(None, description="前ページのレスポンスヘッダーX-Next-Cursorの値"),
+    skip: int = Query(0, ge=0, description="後方互換のためのオフセット（cursor指定時は無視）"),
     limit: int = Query(20, ge=1, le=100),
-    current_user: Optional[User] = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    claims: Optional[TokenData] = Depends(get_optional_user_claims),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """定点一覧を取得"""
-    query = db.query(
-        FixedPoint.id,
-        FixedPoint.user_id,
-        FixedPoint.title,
-        FixedPoint.character_id,
-        FixedPoint.map_id,
-        FixedPoint.created_at,
-        User.username,
-        func.count(Favorite.id).label("favorites_count")
-    ).select_from(FixedPoint).join(
-        User, User.id == FixedPoint.user_id
-    ).outerjoin(
-        Favorite, Favorite.fixed_point_id == FixedPoint.id
+    """定点一覧を取得
+    
+    次のページが存在する場合は X-Next-Cursor ヘッダーにカーソルを返す。
+    cursor を指定すると (ソートキー, id) のキーセットで続きを取得するため、
+    深いページでも先頭ページと同じコストで取得できる。
+    お気に入り数は fixed_points.favorites_count を参照するため集計は不要。
+    ログインしていなくても取得でき、その場合は is_favorited が常に false になる。
+    
+    ユーザーに依存しない一覧はフィルタ条件ごとにキャッシュし、
+    is_favorited はページ内の定点IDでお気に入りを検索して上書きする。
+    """
+    # favorited_by の結果はお気に入りの追加・削除のたびに変わるためキャッシュしない
+    cache_key = None
+    if not favorited_by:
+        cache_key = FixedPointListKey(
+            character_id=character_id or None,
+            map_id=map_id or None,
+            user_id=user_id or None,
+            sort=sort,
+            cursor=cursor,
+            skip=0 if cursor else skip,
+            limit=limit
+        )
+    
+    page = fixed_point_list_cache.get(cache_key) if cache_key else None
+    if page is None:
+        generation = fixed_point_list_cache.generation
+        page = await fetch_fixed_point_list_page(
+            db,
+            character_id=character_id,
+            map_id=map_id,
+            user_id=user_id,
+            favorited_by=favorited_by,
+            sort=sort,
+            cursor=cursor,
+            skip=skip,
+            limit=limit
+        )
+        if cache_key:
+            fixed_point_list_cache.set(cache_key, page, generation)
+    
+    if page.next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = page.next_cursor
+    
+    # ログインユーザーのお気に入り状態を上書き
+    favorited_ids = set()
+    if claims:
+        favorited_ids = await get_favorited_ids(db, claims.user_id, [row["id"] for row in page.rows])
+    
+    return [
+        FixedPointListResponse(**row, is_favorited=row["id"] in favorited_ids)
+        for row in page.rows
+    ]
+
+
+async def fetch_fixed_point_list_page(
+    db: AsyncSession,
+    character_id: Optional[str],
+    map_id: Optional[str],
+    user_id: Optional[int],
+    favorited_by: Optional[int],
+    sort: str,
+    cursor: Optional[str],
+    skip: int,
+    limit: int
+) -> FixedPointListPage:
+    """ユーザーに依存しない一覧の1ページ分をDBから取得"""
+    after = decode_cursor(cursor, sort) if cursor else None
+    query = build_fixed_point_list_query(
+        character_id=character_id,
+        map_id=map_id,
+        user_id=user_id,
+        favorited_by=favorited_by,
+        sort=sort,
+        after=after
     )
     
-    # フィルタ適用
-    if character_id:
-        query = query.filter(FixedPoint.character_id == character_id)
-    if map_id:
-        query = query.filter(FixedPoint.map_id == map_id)
-    if user_id:
-        query = query.filter(FixedPoint.user_id == user_id)
-    if favorited_by:
-        query = query.filter(Favorite.user_id == favorited_by)
+    # ページネーション（次ページの有無を判定するため1件多く取得）
+    if not cursor and skip:
+        query = query.offset(skip)
+    fixed_points = (await db.execute(query.limit(limit + 1))).all()
     
-    # グループ化と並び替え
-    query = query.group_by(
-        FixedPoint.id,
-        FixedPoint.user_id,
-        FixedPoint.title,
-        FixedPoint.character_id,
-        FixedPoint.map_id,
-        FixedPoint.created_at,
-        User.username
-    ).order_by(FixedPoint.created_at.desc())
+    next_cursor = None
+    if len(fixed_points) > limit:
+        fixed_points = fixed_points[:limit]
+        last = fixed_points[-1]
+        sort_value = last.favorites_count if sort == "popular" else last.created_at
+        next_cursor = encode_cursor(sort, sort_value, last.id)
     
-    # ページネーション
-    fixed_points = query.offset(skip).limit(limit).all()
+    rows = [
+        {
+            "id": fp.id,
+            "user_id": fp.user_id,
+            "title": fp.title,
+            "character_id": fp.character_id,
+            "map_id": fp.map_id,
+            "created_at": fp.created_at,
+            "username": fp.username,
+            "favorites_count": fp.favorites_count
+        }
+        for fp in fixed_points
+    ]
+    return FixedPointListPage(rows=rows, next_cursor=next_cursor)
+
+
+def build_fixed_point_version_query(fixed_point_id: int, current_user_id: Optional[int] = None) -> Select:
+    """ETagの計算に必要な値だけを1つのクエリで取得する
     
-    # レスポンスの構築
-    results = []
-    for fp in fixed_points:
-        is_favorited = False
-        if current_user:
-            fav = db.query(Favorite).filter(
-                and_(
-                    Favorite.fixed_point_id == fp.id,
-                    Favorite.user_id == current_user.id
-                )
-            ).first()
-            is_favorited = fav is not None
-        
-        results.append(FixedPointListResponse(
-            id=fp.id,
-            user_id=fp.user_id,
-            title=fp.title,
-            character_id=fp.character_id,
-            map_id=fp.map_id,
-            created_at=fp.created_at,
-            username=fp.username,
-            favorites_count=fp.favorites_count,
-            is_favorited=is_favorited
-        ))
-    
-    return results
+    (updated_at, favorites_count, ステップ数, 最大のステップID, is_favorited)
+    """
+    steps_count = select(func.count(FixedPointStep.id)).where(
+        FixedPointStep.fixed_point_id == FixedPoint.id
+    ).correlate(FixedPoint).scalar_subquery()
+    max_step_id = select(func.max(FixedPointStep.id)).where(
+        FixedPointStep.fixed_point_id == FixedPoint.id
+    ).correlate(FixedPoint).scalar_subquery()
+    
+    if current_user_id:
+        is_favorited = exists().where(
+            and_(
+                Favorite.fixed_point_id == FixedPoint.id,
+                Favorite.user_id == current_user_id
+            )
+        ).correlate(FixedPoint)
+    else:
+        is_favorited = false()
+    
+    return select(
+        FixedPoint.updated_at,
+        FixedPoint.favorites_count,
+        steps_count.label("steps_count"),
+        max_step_id.label("max_step_id"),
+        is_favorited.label("is_favorited")
+    ).where(FixedPoint.id == fixed_point_id)
+
+
+def compute_fixed_point_etag(
+    fixed_point_id: int,
+    updated_at: datetime,
+    favorites_count: int,
+    steps_count: int,
+    max_step_id: Optional[int],
+    is_favorited: bool
+) -> str:
+    """定点詳細のETag（更新日時・ステップ構成・お気に入り数・お気に入り状態のいずれかが変われば変わる）"""
+    version = f"{updated_at.isoformat()}|{favorites_count}|{steps_count}|{max_step_id}|{int(is_favorited)}"
+    digest = hashlib.sha1(version.encode()).hexdigest()[:16]
+    return f'"{fixed_point_id}-{digest}"'
 
 
 @router.get("/{fixed_point_id}", response_model=FixedPointResponse)
 async def get_fixed_point(
+    request: Request,
+    response: Response,
     fixed_point_id: int,
-    current_user: Optional[User] = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    claims: Optional[TokenData] = Depends(get_optional_user_claims),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """特定の定点を取得"""
-    fixed_point = db.query(FixedPoint).options(
-        joinedload(FixedPoint.steps)
-    ).filter(FixedPoint.id == fixed_point_id).first()
+    """特定の定点を取得（ログインしていない場合もお気に入り状態以外は同じ内容を返す）
     
-    if not fixed_point:
+    ETagを返し、If-None-Match が一致する場合は1つのクエリだけで304を返す。
+    """
+    version = (await db.execute(
+        build_fixed_point_version_query(fixed_point_id, claims.user_id if claims else None)
+    )).first()
+    
+    if not version:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Fixed point not found"
         )
     
-    # お気に入り数を取得
-    favorites_count = db.query(func.count(Favorite.id)).filter(
-        Favorite.fixed_point_id == fixed_point_id
-    ).scalar()
+    is_favorited = bool(version.is_favorited)
+    etag = compute_fixed_point_etag(
+        fixed_point_id,
+        updated_at=version.updated_at,
+        favorites_count=version.favorites_count,
+        steps_count=version.steps_count,
+        max_step_id=version.max_step_id,
+        is_favorited=is_favorited
+    )
+    cache_headers = {
+        "ETag": etag,
+        "Cache-Control": DETAIL_CACHE_CONTROL,
+        "Vary": "Authorization",
+    }
+    if etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cache_headers)
     
-    # 現在のユーザーがお気に入りしているか確認
-    is_favorited = False
-    if current_user:
-        fav = db.query(Favorite).filter(
-            and_(
-                Favorite.fixed_point_id == fixed_point_id,
-                Favorite.user_id == current_user.id
-            )
-        ).first()
-        is_favorited = fav is not None
+    fixed_point = await get_fixed_point_with_steps(db, fixed_point_id)
     
-    response = FixedPointResponse.model_validate(fixed_point)
-    response.favorites_count = favorites_count
-    response.is_favorited = is_favorited
+    if not fixed_point:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Fixed point not found"
+        )
     
-    return response
+    # 取得した内容から計算し直し、ETagと本文を一致させる
+    cache_headers["ETag"] = compute_fixed_point_etag(
+        fixed_point_id,
+        updated_at=fixed_point.updated_at,
+        favorites_count=fixed_point.favorites_count,
+        steps_count=len(fixed_point.steps),
+        max_step_id=max((step.id for step in fixed_point.steps), default=None),
+        is_favorited=is_favorited
+    )
+    response.headers.update(cache_headers)
+    
+    fixed_point_response = FixedPointResponse.model_validate(fixed_point)
+    fixed_point_response.is_favorited = is_favorited
+    
+    return fixed_point_response
 
 
 @router.put("/{fixed_point_id}", response_model=FixedPointResponse)
@@ -185,10 +447,10 @@ async def update_fixed_point(
     fixed_point_id: int,
     fixed_point_data: FixedPointUpdate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """定点を更新（作成者のみ）"""
-    fixed_point = db.query(FixedPoint).filter(FixedPoint.id == fixed_point_id).first()
+    fixed_point = await get_fixed_point_with_steps(db, fixed_point_id)
     
     if not fixed_point:
         raise HTTPException(
@@ -202,21 +464,31 @@ async def update_fixed_point(
             detail="Not authorized to update this fixed point"
         )
     
+    # 更新前の条件の一覧からも外れるよう、変更前のマップ・エージェントを控えておく
+    previous_map_id, previous_character_id = fixed_point.map_id, fixed_point.character_id
+    
     # 更新処理
     update_data = fixed_point_data.model_dump(exclude_unset=True)
     for field, value in update_data.items():
         setattr(fixed_point, field, value)
     
-    db.commit()
-    db.refresh(fixed_point)
+    await db.commit()
     
-    # レスポンス用にお気に入り情報を追加
-    favorites_count = db.query(func.count(Favorite.id)).filter(
-        Favorite.fixed_point_id == fixed_point_id
-    ).scalar()
+    # 更新前後の定点が含まれる一覧のキャッシュを削除
+    fixed_point_list_cache.invalidate(
+        map_id=previous_map_id,
+        character_id=previous_character_id,
+        user_id=fixed_point.user_id
+    )
+    fixed_point_list_cache.invalidate(
+        map_id=fixed_point.map_id,
+        character_id=fixed_point.character_id,
+        user_id=fixed_point.user_id
+    )
+    fixed_point = await get_fixed_point_with_steps(db, fixed_point_id)
     
+    # レスポンス用にお気に入り情報を追加
     response = FixedPointResponse.model_validate(fixed_point)
-    response.favorites_count = favorites_count
     response.is_favorited = False  # 自分の投稿
     
     return response
@@ -226,10 +498,10 @@ async def update_fixed_point(
 async def delete_fixed_point(
     fixed_point_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """定点を削除（作成者のみ）"""
-    fixed_point = db.query(FixedPoint).filter(FixedPoint.id == fixed_point_id).first()
+    fixed_point = await db.get(FixedPoint, fixed_point_id)
     
     if not fixed_point:
         raise HTTPException(
@@ -243,7 +515,12 @@ async def delete_fixed_point(
             detail="Not authorized to delete this fixed point"
         )
     
-    db.delete(fixed_point)
-    db.commit()
-
-
+    await db.delete(fixed_point)
+    await db.commit()
+    
+    # 削除した定点が含まれる一覧のキャッシュを削除
+    fixed_point_list_cache.invalidate(
+        map_id=fixed_point.map_id,
+        character_id=fixed_point.character_id,
+        user_id=fixed_point.user_id
+    )
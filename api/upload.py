@@ -1,28 +1,75 @@
 """画像アップロードAPI"""
+import asyncio
+import hashlib
 import os
+import re
+import stat
 import uuid
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, status
+import logging
+from email.utils import formatdate
+from typing import Any, Dict, List, Literal, Optional
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request, Response, UploadFile, File, Query, status
 from fastapi.responses import FileResponse
+from PIL import Image, UnidentifiedImageError
 from sqlalchemy.orm import Session
 import aiofiles
-from PIL import Image
-import io
+import aiofiles.os
 
 from core.database import get_db
 from core.security import get_current_user
 from core.config import settings
+from core.http_cache import etag_matches, not_modified_since
 from models.user import User
+from services.image_processing import (
+    image_processing_service,
+    ImageProcessingBusyError,
+    ImageProcessingError,
+    create_webp_variant,
+    verify_image,
+    VARIANT_SIZES
+)
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/upload", tags=["upload"])
 
 # 許可される画像拡張子
 ALLOWED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp"}
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+MAX_BATCH_UPLOAD_FILES = 5
+# multipartの境界・ヘッダー分の余裕
+MULTIPART_OVERHEAD = 64 * 1024
+# リクエストボディの上限（main.py の BodySizeLimitMiddleware でパース前に適用）
+MAX_UPLOAD_REQUEST_SIZE = MAX_FILE_SIZE + MULTIPART_OVERHEAD
+MAX_BATCH_UPLOAD_REQUEST_SIZE = MAX_BATCH_UPLOAD_FILES * MAX_FILE_SIZE + MULTIPART_OVERHEAD
+UPLOAD_CHUNK_SIZE = 64 * 1024  # 64KB
+BATCH_UPLOAD_CONCURRENCY = 3  # 一括アップロードで同時に処理するファイル数
 UPLOAD_DIR = "uploads"
+UPLOAD_URL_PREFIX = "/api/upload/images/"
+VARIANTS_DIR = os.path.join(UPLOAD_DIR, "variants")  # サムネイル等の派生画像
 
 # アップロードディレクトリの作成
 os.makedirs(UPLOAD_DIR, exist_ok=True)
+os.makedirs(VARIANTS_DIR, exist_ok=True)
+
+# 画像形式 -> 保存時の拡張子（同じ内容は拡張子の表記ゆれに関係なく同じファイルになる）
+FORMAT_EXTENSIONS = {
+    "JPEG": ".jpg",
+    "MPO": ".jpg",
+    "PNG": ".png",
+    "GIF": ".gif",
+    "WEBP": ".webp",
+}
+
+# サーバーが生成した内容の変わらないファイル名（SHA-256 または旧形式の uuid4）
+IMMUTABLE_FILENAME_PATTERN = re.compile(
+    r"^(?:[0-9a-f]{64}|[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})\.[a-z0-9]+$"
+)
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "public, no-cache"
+
+# 派生画像のパス -> 実行中の生成処理（同じ派生画像の同時生成を1回にまとめる）
+_variant_tasks: Dict[str, asyncio.Task] = {}
 
 
 def validate_image(file: UploadFile) -> None:
@@ -43,49 +90,186 @@ def validate_image(file: UploadFile) -> None:
         )
 
 
-async def save_upload_file(upload_file: UploadFile, destination: str) -> None:
-    """アップロードファイルを保存"""
-    async with aiofiles.open(destination, 'wb') as out_file:
-        content = await upload_file.read()
-        
-        # ファイルサイズチェック
-        if len(content) > MAX_FILE_SIZE:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"File size exceeds maximum allowed size of {MAX_FILE_SIZE // 1024 // 1024}MB"
-            )
+async def verify_image_file(path: str) -> Dict[str, Any]:
+    """保存したファイルが画像として開けるかチェックし、メタデータを返す（ワーカープールで実行）"""
+    try:
+        return await image_processing_service.run(verify_image, path)
+    except ImageProcessingBusyError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Image processing is busy, please retry later"
+        )
+    except ImageProcessingError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Image processing is temporarily unavailable, please retry later"
+        )
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError):
+        # Pillowが画像として読み込めなかった（壊れている・画像ではない・大きすぎる）
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid image file"
+        )
+
+
+async def save_upload_file(upload_file: UploadFile) -> Dict[str, Any]:
+    """アップロードファイルを内容のSHA-256ハッシュをファイル名として保存
+    
+    multipart のパーサーがボディを一時ファイルへ書き出した後に呼ばれるため、受信量そのものは
+    BodySizeLimitMiddleware（リクエスト全体の上限）で制限している。ここではファイルごとの上限を確認しながら、
+    一定サイズのチャンクごとに一時ファイルへコピーしてハッシュを計算する（メモリ使用量は1チャンク分に収まる）。
+    検証に成功した場合のみ保存先へアトミックに移動する。
+    同じ内容のファイルが既にある場合は書き込まずに既存のファイルを使う。
+    
+    Returns:
+        保存したファイル名、新規に作成したか（created）と画像のメタデータ（format, width, height）
+    """
+    size_exceeded = HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail=f"File size exceeds maximum allowed size of {MAX_FILE_SIZE // 1024 // 1024}MB"
+    )
+    
+    # サイズが分かっている場合は読み込む前に拒否
+    if upload_file.size is not None and upload_file.size > MAX_FILE_SIZE:
+        raise size_exceeded
+    
+    # 同じファイルシステム上に一時ファイルを作成（os.replaceでアトミックに移動するため）
+    tmp_path = os.path.join(UPLOAD_DIR, f".{uuid.uuid4()}.part")
+    try:
+        total_size = 0
+        digest = hashlib.sha256()
+        async with aiofiles.open(tmp_path, 'wb') as out_file:
+            while chunk := await upload_file.read(UPLOAD_CHUNK_SIZE):
+                # ファイルサイズチェック
+                total_size += len(chunk)
+                if total_size > MAX_FILE_SIZE:
+                    raise size_exceeded
+                digest.update(chunk)
+                await out_file.write(chunk)
         
         # 画像として開けるかチェック
-        try:
-            img = Image.open(io.BytesIO(content))
-            img.verify()
-        except Exception:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Invalid image file"
-            )
+        metadata = await verify_image_file(tmp_path)
         
-        await out_file.write(content)
+        file_ext = FORMAT_EXTENSIONS.get(
+            metadata["format"],
+            os.path.splitext(upload_file.filename)[1].lower()
+        )
+        filename = f"{digest.hexdigest()}{file_ext}"
+        destination = os.path.join(UPLOAD_DIR, filename)
+        
+        # 同じ内容のファイルが既にあれば再利用する（内容が同じなので同時に書き込まれても問題ない）
+        created = not await aiofiles.os.path.exists(destination)
+        if created:
+            await aiofiles.os.replace(tmp_path, destination)
+        else:
+            # 未参照のファイルでもガベージコレクションの猶予期間を延ばす
+            await asyncio.to_thread(os.utime, destination)
+        return {"filename": filename, "created": created, **metadata}
+    finally:
+        try:
+            await aiofiles.os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+
+
+def get_variant_path(filename: str, size: str) -> str:
+    """派生画像（WebP）の保存先"""
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(VARIANTS_DIR, f"{stem}_{size}.webp")
+
+
+async def ensure_variant(filename: str, size: str) -> str:
+    """派生画像を取得（存在しない場合はプロセスプールで生成してディスクにキャッシュ）"""
+    variant_path = get_variant_path(filename, size)
+    if await aiofiles.os.path.exists(variant_path):
+        return variant_path
+    
+    task = _variant_tasks.get(variant_path)
+    if task is None:
+        task = asyncio.create_task(image_processing_service.run(
+            create_webp_variant,
+            os.path.join(UPLOAD_DIR, filename),
+            variant_path,
+            VARIANT_SIZES[size]
+        ))
+        _variant_tasks[variant_path] = task
+        task.add_done_callback(lambda _: _variant_tasks.pop(variant_path, None))
+    
+    await asyncio.shield(task)
+    return variant_path
+
+
+async def generate_variants(filename: str) -> None:
+    """アップロード直後に全サイズの派生画像を生成"""
+    results = await asyncio.gather(
+        *[ensure_variant(filename, size) for size in VARIANT_SIZES],
+        return_exceptions=True
+    )
+    for size, result in zip(VARIANT_SIZES, results):
+        if isinstance(result, Exception):
+            logger.error(f"Failed to generate {size} variant for {filename}: {result!r}")
+
+
+async def store_image(file: UploadFile) -> Dict[str, Any]:
+    """画像を検証して内容アドレスのファイル名で保存し、レスポンス用の情報を返す
+    
+    created は今回のアップロードで新しく作成したファイルかどうか（レスポンスには含めない）。
+    """
+    # バリデーション
+    validate_image(file)
+    
+    # ファイルを保存
+    saved = await save_upload_file(file)
+    
+    # URLを返す
+    return {
+        "url": f"{UPLOAD_URL_PREFIX}{saved['filename']}",
+        "filename": saved["filename"],
+        "width": saved["width"],
+        "height": saved["height"],
+        "created": saved["created"]
+    }
+
+
+async def store_images(files: List[UploadFile]) -> List[Dict[str, Any]]:
+    """複数の画像を並行して保存（一つでも失敗したら全体を失敗にする）
+    
+    失敗した場合も保存済みのファイルは削除しない。同じ内容のファイルを同時にアップロードした
+    別のリクエストが既に参照している可能性があるため。参照されないまま残ったファイルは
+    scripts/gc_uploads.py が猶予期間の経過後に削除する。
+    """
+    # 書き込みを始める前に全ファイルの拡張子・Content-Typeを確認
+    for file in files:
+        validate_image(file)
+    
+    semaphore = asyncio.Semaphore(BATCH_UPLOAD_CONCURRENCY)
+    
+    async def store_with_limit(file: UploadFile) -> Dict[str, Any]:
+        async with semaphore:
+            return await store_image(file)
+    
+    outcomes = await asyncio.gather(
+        *[store_with_limit(file) for file in files],
+        return_exceptions=True
+    )
+    
+    errors = [outcome for outcome in outcomes if isinstance(outcome, BaseException)]
+    if errors:
+        raise errors[0]
+    
+    return outcomes
 
 
 @router.post("/image", response_model=dict)
 async def upload_image(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """画像をアップロード"""
-    # バリデーション
-    validate_image(file)
-    
-    # ユニークなファイル名を生成
-    file_ext = os.path.splitext(file.filename)[1].lower()
-    unique_filename = f"{uuid.uuid4()}{file_ext}"
-    file_path = os.path.join(UPLOAD_DIR, unique_filename)
-    
-    # ファイルを保存
     try:
-        await save_upload_file(file, file_path)
+        result = await store_image(file)
     except HTTPException:
         raise
     except Exception as e:
@@ -94,26 +278,89 @@ async def upload_image(
             detail="Failed to save file"
         )
     
-    # URLを返す
-    image_url = f"/api/upload/images/{unique_filename}"
+    # 派生画像はレスポンス後に生成する（既存のファイルなら生成済み）
+    if result.pop("created"):
+        background_tasks.add_task(generate_variants, result["filename"])
     
-    return {
-        "url": image_url,
-        "filename": unique_filename
+    return result
+
+
+async def stat_file(path: str) -> Optional[os.stat_result]:
+    """ファイルの情報を取得（イベントループをブロックしないようスレッドで実行、通常のファイルでなければNone）"""
+    try:
+        stat_result = await aiofiles.os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat_result if stat.S_ISREG(stat_result.st_mode) else None
+
+
+class ImmutableFileResponse(FileResponse):
+    """Last-Modified を付けない FileResponse（内容の変わらないファイル用）
+    
+    FileResponse はファイルの更新日時から Last-Modified を補い、If-Range の比較にも使うため、
+    Last-Modified を取り除き、If-Range はETagとだけ比較する。
+    """
+    
+    def set_stat_headers(self, stat_result: os.stat_result) -> None:
+        super().set_stat_headers(stat_result)
+        del self.headers["last-modified"]
+    
+    def _should_use_range(self, http_if_range: str) -> bool:
+        return http_if_range == self.headers["etag"]
+
+
+def image_response(
+    request: Request,
+    path: str,
+    stat_result: os.stat_result,
+    filename: str,
+    size: Optional[str] = None,
+    media_type: Optional[str] = None
+) -> Response:
+    """キャッシュ用のヘッダーを付けて画像を返す（条件付きリクエストには304を返す）
+    
+    内容の変わらないファイル名は、ファイル名（と派生画像のサイズ）を強いETagにして
+    ブラウザやCDNに無期限でキャッシュさせる。それ以外は毎回再検証させる。
+    Rangeリクエストは FileResponse が処理する。
+    """
+    if IMMUTABLE_FILENAME_PATTERN.match(filename):
+        stem = os.path.splitext(filename)[0]
+        etag = f'"{stem}-{size}"' if size else f'"{stem}"'
+        cache_control = IMMUTABLE_CACHE_CONTROL
+        # 重複排除で同じ画像が再アップロードされると更新日時が変わるため、Last-Modified は付けない（ETagで足りる）
+        last_modified = None
+    else:
+        etag = f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+        cache_control = REVALIDATE_CACHE_CONTROL
+        last_modified = stat_result.st_mtime
+    
+    headers = {
+        "ETag": etag,
+        "Cache-Control": cache_control,
     }
+    if last_modified is not None:
+        headers["Last-Modified"] = formatdate(last_modified, usegmt=True)
+    if etag_matches(request, etag) or \
+            (last_modified is not None and not_modified_since(request, last_modified)):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    response_class = FileResponse if last_modified is not None else ImmutableFileResponse
+    return response_class(path, media_type=media_type, headers=headers, stat_result=stat_result)
 
 
 @router.get("/images/{filename}")
-async def get_image(filename: str):
-    """アップロードされた画像を取得"""
-    file_path = os.path.join(UPLOAD_DIR, filename)
-    
-    if not os.path.exists(file_path):
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Image not found"
-        )
+async def get_image(
+    request: Request,
+    filename: str,
+    size: Optional[Literal["thumb", "medium", "full"]] = Query(None, description="派生画像のサイズ"),
+    image_format: Optional[Literal["webp"]] = Query(None, alias="format", description="派生画像の形式"),
+):
+    """アップロードされた画像を取得
     
+    size または format を指定するとリサイズしたWebPの派生画像を返す。
+    派生画像がない古いアップロードはその場で生成してキャッシュする。
+    ETag / Last-Modified による条件付きリクエストとRangeリクエストに対応する。
+    """
     # 安全性のため、ファイル名を検証
     if "/" in filename or "\\" in filename or ".." in filename:
         raise HTTPException(
@@ -121,50 +368,63 @@ async def get_image(filename: str):
             detail="Invalid filename"
         )
     
-    return FileResponse(file_path)
+    file_path = os.path.join(UPLOAD_DIR, filename)
+    file_stat = await stat_file(file_path)
+    
+    if file_stat is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Image not found"
+        )
+    
+    if size is None and image_format is None:
+        return image_response(request, file_path, file_stat, filename)
+    
+    variant_size = size or "full"
+    try:
+        variant_path = await ensure_variant(filename, variant_size)
+        variant_stat = await stat_file(variant_path)
+        if variant_stat is None:
+            raise FileNotFoundError(variant_path)
+    except Exception as e:
+        # 派生画像を生成できない場合は元の画像を返す
+        logger.error(f"Failed to generate {variant_size} variant for {filename}: {e!r}")
+        response = image_response(request, file_path, file_stat, filename)
+        # 派生画像を生成できるようになったら置き換わるよう、無期限にはキャッシュさせない
+        response.headers["Cache-Control"] = REVALIDATE_CACHE_CONTROL
+        return response
+    
+    return image_response(
+        request, variant_path, variant_stat, filename, size=variant_size, media_type="image/webp"
+    )
 
 
 @router.post("/images/batch", response_model=List[dict])
 async def upload_images_batch(
+    background_tasks: BackgroundTasks,
     files: List[UploadFile] = File(...),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """複数の画像を一括アップロード"""
-    if len(files) > 5:
+    if len(files) > MAX_BATCH_UPLOAD_FILES:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Maximum 5 images allowed at once"
+            detail=f"Maximum {MAX_BATCH_UPLOAD_FILES} images allowed at once"
         )
     
-    results = []
+    # 並行して保存（一つでも失敗したら全体を失敗にする）
+    results = await store_images(files)
     
-    for file in files:
-        try:
-            # バリデーション
-            validate_image(file)
-            
-            # ユニークなファイル名を生成
-            file_ext = os.path.splitext(file.filename)[1].lower()
-            unique_filename = f"{uuid.uuid4()}{file_ext}"
-            file_path = os.path.join(UPLOAD_DIR, unique_filename)
-            
-            # ファイルを保存
-            await save_upload_file(file, file_path)
-            
-            # URLを追加
-            image_url = f"/api/upload/images/{unique_filename}"
-            results.append({
-                "url": image_url,
-                "filename": unique_filename
-            })
-        except HTTPException as e:
-            # 一つでも失敗したら全体をロールバック
-            for result in results:
-                try:
-                    os.remove(os.path.join(UPLOAD_DIR, result["filename"]))
-                except:
-                    pass
-            raise e
-    
-    return results
\ No newline at end of file
+    # 派生画像はレスポンス後に生成する（既存のファイルなら生成済み）
+    for result in results:
+        if result.pop("created"):
+            background_tasks.add_task(generate_variants, result["filename"])
+    
+    return results
+
+
+@router.get("/processing/stats")
+async def get_processing_stats():
+    """画像処理ワーカープールのキュー長とレイテンシ"""
+    return image_processing_service.stats()
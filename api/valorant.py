@@ -1,68 +1,58 @@
 """Valorant API エンドポイント"""
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request, Response
 from typing import List, Dict, Any
-from services.valorant import get_valorant_service
+from core.http_cache import etag_matches
+from services.valorant import valorant_catalog_cache, ValorantLanguage
 from services.image_cache import image_cache_service
 
 router = APIRouter(prefix="/api/valorant", tags=["valorant"])
 
 
 @router.get("/agents", response_model=List[Dict[str, Any]])
-async def get_agents(language: str = "ja-JP"):
+async def get_agents(request: Request, response: Response, language: ValorantLanguage = "ja-JP"):
     """VALORANTのエージェント一覧を取得（画像はキャッシュ済みのローカルパスに変換）
     
     Args:
-        language: 言語コード（デフォルト: ja-JP）
+        language: 言語コード（デフォルト: ja-JP、対応していない言語は422）
     
     Returns:
         エージェント情報のリスト（画像URLはローカルパス）
+        ETagにはカタログのゲームバージョンを返す
     """
-    service = get_valorant_service()
-    async with service:
-        agents = await service.get_agents(language)
-        if not agents:
-            raise HTTPException(status_code=503, detail="Failed to fetch agents from Valorant API")
-        
-        # 画像をキャッシュして、URLをローカルパスに置き換える
-        for agent in agents:
-            if agent.get('displayIcon'):
-                cached_path = await image_cache_service.cache_agent_image(
-                    agent['uuid'], 
-                    agent['displayIcon']
-                )
-                if cached_path:
-                    agent['displayIcon'] = cached_path
-        
-        return agents
+    agents = await valorant_catalog_cache.get_agents(language)
+    if not agents:
+        raise HTTPException(status_code=503, detail="Failed to fetch agents from Valorant API")
+    
+    etag = valorant_catalog_cache.get_etag("agents", language)
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    if etag:
+        response.headers["ETag"] = etag
+    
+    # 画像をキャッシュして、URLをローカルパスに置き換える
+    return await image_cache_service.localize_agents(agents)
 
 
 @router.get("/maps", response_model=List[Dict[str, Any]])
-async def get_maps(language: str = "ja-JP"):
+async def get_maps(request: Request, response: Response, language: ValorantLanguage = "ja-JP"):
     """VALORANTのマップ一覧を取得（画像はキャッシュ済みのローカルパスに変換）
     
     Args:
-        language: 言語コード（デフォルト: ja-JP）
+        language: 言語コード（デフォルト: ja-JP、対応していない言語は422）
     
     Returns:
         マップ情報のリスト（画像URLはローカルパス）
+        ETagにはカタログのゲームバージョンを返す
     """
-    service = get_valorant_service()
-    async with service:
-        maps = await service.get_maps(language)
-        if not maps:
-            raise HTTPException(status_code=503, detail="Failed to fetch maps from Valorant API")
-        
-        # 画像をキャッシュして、URLをローカルパスに置き換える
-        for map_data in maps:
-            if map_data.get('displayIcon') and map_data.get('splash'):
-                cached_paths = await image_cache_service.cache_map_images(
-                    map_data['uuid'],
-                    map_data['displayIcon'],
-                    map_data['splash']
-                )
-                if cached_paths.get('displayIcon'):
-                    map_data['displayIcon'] = cached_paths['displayIcon']
-                if cached_paths.get('splash'):
-                    map_data['splash'] = cached_paths['splash']
-        
-        return maps
\ No newline at end of file
+    maps = await valorant_catalog_cache.get_maps(language)
+    if not maps:
+        raise HTTPException(status_code=503, detail="Failed to fetch maps from Valorant API")
+    
+    etag = valorant_catalog_cache.get_etag("maps", language)
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    if etag:
+        response.headers["ETag"] = etag
+    
+    # 画像をキャッシュして、URLをローカルパスに置き換える
+    return await image_cache_service.localize_maps(maps)
\ No newline at end of file
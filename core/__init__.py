@@ -1,4 +1,21 @@
 from .config import settings
-from .database import Base, engine, get_db, SessionLocal
+from .database import (
+    Base,
+    engine,
+    get_db,
+    SessionLocal,
+    async_engine,
+    get_async_db,
+    AsyncSessionLocal,
+)
 
-__all__ = ["settings", "Base", "engine", "get_db", "SessionLocal"]
\ No newline at end of file
+__all__ = [
+    "settings",
+    "Base",
+    "engine",
+    "get_db",
+    "SessionLocal",
+    "async_engine",
+    "get_async_db",
+    "AsyncSessionLocal",
+]
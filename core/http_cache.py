@@ -0,0 +1,31 @@
+"""HTTPキャッシュ（条件付きリクエスト）のユーティリティ"""
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request
+
+
+def etag_matches(request: Request, etag: Optional[str]) -> bool:
+    """If-None-Match がETagと一致するか（弱い比較）"""
+    if etag is None:
+        return False
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag.removeprefix("W/") in candidates
+
+
+def not_modified_since(request: Request, last_modified: float) -> bool:
+    """If-Modified-Since 以降に更新されていないか（If-None-Match がある場合はそちらを優先する）"""
+    if_modified_since = request.headers.get("if-modified-since")
+    if not if_modified_since or "if-none-match" in request.headers:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since).timestamp()
+    except (TypeError, ValueError):
+        return False
+    # HTTPの日時は秒単位のため、ミリ秒以下は切り捨てて比較する
+    return int(last_modified) <= since
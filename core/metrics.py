@@ -0,0 +1,14 @@
+"""メトリクス集計のユーティリティ"""
+from typing import Dict, Iterable
+
+
+def latency_summary(samples: Iterable[float]) -> Dict[str, float]:
+    """秒単位のレイテンシのサンプルから平均・p95・最大（ミリ秒）を求める"""
+    ordered = sorted(samples)
+    if not ordered:
+        return {"avg_ms": 0.0, "p95_ms": 0.0, "max_ms": 0.0}
+    return {
+        "avg_ms": round(sum(ordered) / len(ordered) * 1000, 2),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2),
+    }
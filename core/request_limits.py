@@ -0,0 +1,54 @@
+"""リクエストボディのサイズ制限"""
+from typing import Dict
+
+from fastapi import HTTPException, status
+from fastapi.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+class BodySizeLimitMiddleware:
+    """指定したパスのリクエストボディが上限を超えた場合に413を返す
+    
+    multipart のフォームはハンドラーの実行前に全体が一時ファイルへ読み込まれるため、
+    ハンドラー内のチェックでは受信量を制限できない。ここでパース前に制限する。
+    Content-Length が上限を超える場合は読み込まずに拒否し、
+    Content-Length がない（chunked）場合は受信しながら数えて上限を超えた時点で中断する。
+    """
+    
+    def __init__(self, app: ASGIApp, limits: Dict[str, int]):
+        self.app = app
+        # パス -> ボディの最大バイト数
+        self.limits = limits
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] not in self.limits:
+            await self.app(scope, receive, send)
+            return
+        
+        max_body_size = self.limits[scope["path"]]
+        detail = f"Request body exceeds maximum allowed size of {max_body_size} bytes"
+        
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > max_body_size:
+            response = JSONResponse(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                content={"detail": detail}
+            )
+            await response(scope, receive, send)
+            return
+        
+        received = 0
+        
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_body_size:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=detail
+                    )
+            return message
+        
+        await self.app(scope, limited_receive, send)
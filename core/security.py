@@ -1,32 +1,66 @@
 """セキュリティ関連のユーティリティ"""
+from typing import Optional
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from core.database import get_db
-from services.auth import AuthService
+from core.database import get_async_db
+from services.auth import AuthService, principal_cache
 from models.user import User
+from schemas.auth import TokenData
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
+# Authorizationヘッダーがない場合にエラーにせずNoneを返す（未ログインでも閲覧できるエンドポイント用）
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login", auto_error=False)
 
 
-async def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
-) -> User:
-    """現在のユーザーを取得"""
-    credentials_exception = HTTPException(
+def credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    
+
+
+async def get_current_user_claims(token: str = Depends(oauth2_scheme)) -> TokenData:
+    """JWTのクレームのみを取得（user_id だけが必要なエンドポイント用、DBにはアクセスしない）"""
     token_data = AuthService.decode_token(token)
     if token_data is None:
-        raise credentials_exception
+        raise credentials_exception()
+    return token_data
+
+
+async def get_optional_user_claims(
+    token: Optional[str] = Depends(optional_oauth2_scheme)
+) -> Optional[TokenData]:
+    """ログインしていればJWTのクレームを、未ログインならNoneを返す
+    
+    Authorizationヘッダーがない匿名リクエストはトークンの検証もDBへのアクセスも行わない。
+    トークンが付いていて無効な場合は401を返す。
+    """
+    if token is None:
+        return None
+    return await get_current_user_claims(token)
+
+
+async def get_current_user(
+    token_data: TokenData = Depends(get_current_user_claims),
+    db: AsyncSession = Depends(get_async_db)
+) -> User:
+    """現在のユーザーを取得
+    
+    取得したユーザーはセッションから切り離してキャッシュするため、
+    リレーションの遅延ロードや変更の保存には使えない。
+    """
+    user = principal_cache.get(token_data.user_id)
+    if user is not None:
+        return user
     
-    user = db.query(User).filter(User.id == token_data.user_id).first()
+    user = await db.get(User, token_data.user_id)
     if user is None:
-        raise credentials_exception
+        raise credentials_exception()
     
-    return user
\ No newline at end of file
+    # 他のリクエストと共有するため、このリクエストのセッションから切り離す
+    db.expunge(user)
+    principal_cache.set(user)
+    return user
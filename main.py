@@ -1,14 +1,75 @@
-from fastapi import FastAPI
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 import uvicorn
 from api import valorant, auth, fixed_points, upload
 from routers import discord_auth, favorites
+from core.config import settings
+from core.request_limits import BodySizeLimitMiddleware
+from services.auth import password_hasher, prune_auth_tokens_periodically
+from services.http_clients import http_clients
+from services.image_cache import image_cache_service
+from services.image_processing import image_processing_service
+from services.oauth_state import oauth_state_store
+from services.valorant import warm_up_catalog
+
+logger = logging.getLogger(__name__)
+
+
+async def warm_up(app: FastAPI) -> None:
+    """Valorantのカタログと画像を事前に取得し、完了後にreadyにする"""
+    try:
+        if settings.VALORANT_WARMUP_LANGUAGES:
+            await asyncio.wait_for(
+                warm_up_catalog(settings.VALORANT_WARMUP_LANGUAGES),
+                timeout=settings.WARMUP_TIMEOUT_SECONDS
+            )
+    except Exception as e:
+        # ウォームアップに失敗してもリクエスト時に取得できるため、受付は開始する
+        logger.error(f"Warmup failed: {e!r}")
+    finally:
+        app.state.ready = True
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.ready = False
+    # 外部API用の共有HTTPクライアントを作成
+    await http_clients.start()
+    warmup_task = asyncio.create_task(warm_up(app))
+    # 期限切れのリフレッシュトークンを定期的に削除
+    prune_task = asyncio.create_task(prune_auth_tokens_periodically())
+    yield
+    warmup_task.cancel()
+    prune_task.cancel()
+    # キャンセルしたタスクが終了してから、タスクが使っているクライアントやプールを閉じる
+    await asyncio.gather(warmup_task, prune_task, return_exceptions=True)
+    # 共有HTTPセッションを閉じる
+    await http_clients.close()
+    await image_cache_service.close()
+    image_processing_service.shutdown()
+    password_hasher.shutdown()
+    await oauth_state_store.close()
+
 
 app = FastAPI(
     title="Fixed Points Backend",
     description="Backend API for Fixed Points application",
     version="0.1.0",
+    lifespan=lifespan,
+)
+
+# アップロードのボディサイズ制限（multipartのパース前に適用。413にもCORSヘッダーが付くようCORSより内側に置く）
+app.add_middleware(
+    BodySizeLimitMiddleware,
+    limits={
+        "/api/upload/image": upload.MAX_UPLOAD_REQUEST_SIZE,
+        "/api/upload/images/batch": upload.MAX_BATCH_UPLOAD_REQUEST_SIZE,
+    },
 )
 
 # CORS設定（フロントエンドからのアクセスを許可）
@@ -25,6 +86,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],  # カーソルページネーション用
 )
 
 
@@ -34,10 +96,19 @@ async def root():
 
 
 @app.get("/health")
-async def health_check():
+async def health_check(request: Request):
+    # ウォームアップが終わるまでは503を返し、ロードバランサーからの振り分けを待つ
+    if not request.app.state.ready:
+        return JSONResponse(status_code=503, content={"status": "warming_up"})
     return {"status": "healthy"}
 
 
+@app.get("/health/upstreams")
+async def upstream_health():
+    """外部API（上流）ごとのレイテンシとエラー率"""
+    return http_clients.stats()
+
+
 # 静的ファイルの配信設定
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from core.database import Base
@@ -14,4 +14,9 @@ class AuthToken(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # リレーション
-    user = relationship("User", back_populates="auth_tokens")
\ No newline at end of file
+    user = relationship("User", back_populates="auth_tokens")
+    
+    __table_args__ = (
+        # 期限切れトークンの定期削除用
+        Index('ix_auth_tokens_expires_at', 'expires_at'),
+    )
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, DateTime, ForeignKey, UniqueConstraint
+from sqlalchemy import Column, Integer, DateTime, ForeignKey, UniqueConstraint, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from core.database import Base
@@ -15,6 +15,10 @@ class Favorite(Base):
     # ユーザーが同じ定点を複数回お気に入りできないようにする
     __table_args__ = (
         UniqueConstraint('user_id', 'fixed_point_id', name='unique_user_fixed_point_favorite'),
+        # 定点側からの参照（削除時のカスケード・集計）用
+        Index('ix_favorites_fixed_point_id', 'fixed_point_id'),
+        # 自分のお気に入り一覧（新しい順）用
+        Index('ix_favorites_user_id_created_at', 'user_id', 'created_at'),
     )
     
     # リレーション
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Float
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Float, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from core.database import Base
@@ -10,11 +10,28 @@ class FixedPoint(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     title = Column(String(255), nullable=False)
-    character_id = Column(String(50), nullable=False, index=True)  # Riot APIのエージェントID
-    map_id = Column(String(50), nullable=False, index=True)  # Riot APIのマップID
+    character_id = Column(String(50), nullable=False)  # Riot APIのエージェントID
+    map_id = Column(String(50), nullable=False)  # Riot APIのマップID
+    favorites_count = Column(Integer, nullable=False, default=0, server_default="0")  # お気に入り数（favoritesの書き込み時に更新）
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
+    __table_args__ = (
+        # 一覧のキーセットページネーション（created_at desc, id desc）用
+        Index('ix_fixed_points_created_at_id', 'created_at', 'id'),
+        # 人気順（favorites_count desc, id desc）用
+        Index('ix_fixed_points_favorites_count_id', 'favorites_count', 'id'),
+        # 一覧のフィルタ（マップ・エージェント・ユーザー）と並び順の組み合わせ用
+        Index('ix_fixed_points_map_id_character_id_created_at_id', 'map_id', 'character_id', 'created_at', 'id'),
+        Index('ix_fixed_points_map_id_created_at_id', 'map_id', 'created_at', 'id'),
+        Index('ix_fixed_points_character_id_created_at_id', 'character_id', 'created_at', 'id'),
+        Index('ix_fixed_points_user_id_created_at_id', 'user_id', 'created_at', 'id'),
+        Index('ix_fixed_points_map_id_character_id_favorites_count_id', 'map_id', 'character_id', 'favorites_count', 'id'),
+        Index('ix_fixed_points_map_id_favorites_count_id', 'map_id', 'favorites_count', 'id'),
+        Index('ix_fixed_points_character_id_favorites_count_id', 'character_id', 'favorites_count', 'id'),
+        Index('ix_fixed_points_user_id_favorites_count_id', 'user_id', 'favorites_count', 'id'),
+    )
+    
     # リレーション
     user = relationship("User", back_populates="fixed_points")
     steps = relationship("FixedPointStep", back_populates="fixed_point", cascade="all, delete-orphan", order_by="FixedPointStep.step_order")
@@ -36,5 +53,10 @@ class FixedPointStep(Base):
     skill_position_y = Column(Float)  # スキル着弾地点のY座標（0-1の正規化座標）
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
+    __table_args__ = (
+        # 定点ごとのステップ取得（step_order順）用
+        Index('ix_fixed_point_steps_fixed_point_id_step_order', 'fixed_point_id', 'step_order'),
+    )
+    
     # リレーション
     fixed_point = relationship("FixedPoint", back_populates="steps")
\ No newline at end of file
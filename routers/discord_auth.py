@@ -1,22 +1,23 @@
-from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi import APIRouter, HTTPException, Depends
 from fastapi.responses import RedirectResponse
-from sqlalchemy.orm import Session
-from typing import Optional
-import httpx
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 import secrets
-import hashlib
-from datetime import datetime, timezone, timedelta
+from datetime import datetime, timezone
 
-from core.database import get_db
+from core.database import get_async_db
 from core.config import settings
 from models.user import User, AuthProvider
-from models.auth_token import AuthToken
-from services.auth import AuthService
+from services.auth import AuthService, principal_cache
+from services.fixed_point_cache import fixed_point_list_cache
+from services.http_clients import http_clients
+from services.oauth_state import oauth_state_store
 
 router = APIRouter(prefix="/api/auth/discord", tags=["Discord OAuth"])
 
-# PKCE用のstate管理（本番環境ではRedisなどを使用）
-state_store = {}
+DISCORD_API_BASE_URL = "https://discord.com/api"
+# 接続はアプリケーション全体で共有する（lifespanで作成・終了）
+http_clients.register("discord", base_url=DISCORD_API_BASE_URL)
 
 @router.get("/login")
 async def discord_login():
@@ -26,7 +27,7 @@ async def discord_login():
     
     # PKCEのstate生成
     state = secrets.token_urlsafe(32)
-    state_store[state] = {"timestamp": datetime.now(timezone.utc)}
+    await oauth_state_store.put(state, {"created_at": datetime.now(timezone.utc).isoformat()})
     
     # Discord OAuth認証URL
     discord_auth_url = (
@@ -44,149 +45,136 @@ async def discord_login():
 async def discord_callback(
     code: str,
     state: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Discord OAuth認証コールバック"""
     if not settings.DISCORD_CLIENT_ID or not settings.DISCORD_CLIENT_SECRET:
         raise HTTPException(status_code=500, detail="Discord OAuth is not configured")
     
-    # state検証
-    if state not in state_store:
+    # state検証（取り出すと同時に削除されるため、同じstateは一度しか使えない）
+    if await oauth_state_store.pop(state) is None:
         raise HTTPException(status_code=400, detail="Invalid state")
     
-    # state使用後は削除
-    del state_store[state]
-    
     # アクセストークンの交換
-    async with httpx.AsyncClient() as client:
-        token_response = await client.post(
-            "https://discord.com/api/oauth2/token",
-            data={
-                "client_id": settings.DISCORD_CLIENT_ID,
-                "client_secret": settings.DISCORD_CLIENT_SECRET,
-                "grant_type": "authorization_code",
-                "code": code,
-                "redirect_uri": settings.DISCORD_REDIRECT_URI,
-            },
-            headers={"Content-Type": "application/x-www-form-urlencoded"}
-        )
-        
-        if token_response.status_code != 200:
-            raise HTTPException(status_code=400, detail="Failed to exchange code for token")
-        
-        token_data = token_response.json()
-        access_token = token_data["access_token"]
-        
-        # ユーザー情報の取得
-        user_response = await client.get(
-            "https://discord.com/api/users/@me",
-            headers={"Authorization": f"Bearer {access_token}"}
-        )
-        
-        if user_response.status_code != 200:
-            raise HTTPException(status_code=400, detail="Failed to get user info")
-        
-        user_data = user_response.json()
-        
-        # ユーザー情報の処理
-        discord_id = user_data["id"]
-        username = user_data["username"]
-        email = user_data.get("email")
-        avatar_url = None
-        
-        if user_data.get("avatar"):
-            avatar_url = f"https://cdn.discordapp.com/avatars/{discord_id}/{user_data['avatar']}.png"
-        
-        # 既存ユーザーの確認（Discord IDで検索）
-        existing_user = db.query(User).filter(
-            User.discord_id == discord_id
-        ).first()
-        
-        if existing_user:
-            # 既存ユーザーの情報更新
-            # ユーザー名の重複チェック（自分以外のユーザーで）
-            username_exists = db.query(User).filter(
+    client = http_clients.get("discord")
+    token_response = await client.post(
+        "/oauth2/token",
+        data={
+            "client_id": settings.DISCORD_CLIENT_ID,
+            "client_secret": settings.DISCORD_CLIENT_SECRET,
+            "grant_type": "authorization_code",
+            "code": code,
+            "redirect_uri": settings.DISCORD_REDIRECT_URI,
+        },
+        headers={"Content-Type": "application/x-www-form-urlencoded"}
+    )
+    
+    if token_response.status_code != 200:
+        raise HTTPException(status_code=400, detail="Failed to exchange code for token")
+    
+    token_data = token_response.json()
+    access_token = token_data["access_token"]
+    
+    # ユーザー情報の取得
+    user_response = await client.get(
+        "/users/@me",
+        headers={"Authorization": f"Bearer {access_token}"}
+    )
+    
+    if user_response.status_code != 200:
+        raise HTTPException(status_code=400, detail="Failed to get user info")
+    
+    user_data = user_response.json()
+    
+    # ユーザー情報の処理
+    discord_id = user_data["id"]
+    username = user_data["username"]
+    email = user_data.get("email")
+    avatar_url = None
+    
+    if user_data.get("avatar"):
+        avatar_url = f"https://cdn.discordapp.com/avatars/{discord_id}/{user_data['avatar']}.png"
+    
+    # 既存ユーザーの確認（Discord IDで検索）
+    existing_user = await db.scalar(
+        select(User).where(User.discord_id == discord_id)
+    )
+    
+    username_changed = False
+    if existing_user:
+        # 既存ユーザーの情報更新
+        # ユーザー名の重複チェック（自分以外のユーザーで）
+        username_exists = await db.scalar(
+            select(User.id).where(
                 User.username == username,
                 User.id != existing_user.id
-            ).first()
-            if username_exists:
-                # ユーザー名が重複している場合、Discord IDをサフィックスとして追加
-                username = f"{username}_{discord_id[:8]}"
-            
-            existing_user.username = username
-            existing_user.email = email
-            existing_user.avatar_url = avatar_url
-            user = existing_user
-        else:
-            # ユーザー名の重複チェック
-            username_exists = db.query(User).filter(User.username == username).first()
-            if username_exists:
-                # ユーザー名が重複している場合、Discord IDをサフィックスとして追加
-                username = f"{username}_{discord_id[:8]}"
-            
-            # 新規ユーザー作成
-            user = User(
-                username=username,
-                email=email,
-                discord_id=discord_id,
-                auth_provider=AuthProvider.DISCORD,
-                avatar_url=avatar_url
             )
-            db.add(user)
-        
-        db.commit()
-        db.refresh(user)
-        
-        # JWTトークンの生成
-        access_token_jwt = AuthService.create_access_token(data={
-            "user_id": user.id,
-            "username": user.username,
-            "email": user.email
-        })
-        refresh_token_jwt = AuthService.create_refresh_token(data={
-            "user_id": user.id,
-            "username": user.username,
-            "email": user.email
-        })
-        
-        # リフレッシュトークンをデータベースに保存
-        # リフレッシュトークンのハッシュ化
-        token_hash = hashlib.sha256(refresh_token_jwt.encode()).hexdigest()
-        
-        auth_token = AuthToken(
-            user_id=user.id,
-            token_hash=token_hash,
-            expires_at=datetime.now(timezone.utc) + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
         )
-        db.add(auth_token)
-        db.commit()
-        
-        # フロントエンドにリダイレクト（トークンをクエリパラメータで渡す）
-        frontend_url = f"{settings.FRONTEND_URL}/auth/callback?access_token={access_token_jwt}&refresh_token={refresh_token_jwt}"
-        
-        return RedirectResponse(url=frontend_url)
+        if username_exists:
+            # ユーザー名が重複している場合、Discord IDをサフィックスとして追加
+            username = f"{username}_{discord_id[:8]}"
+        
+        username_changed = existing_user.username != username
+        existing_user.username = username
+        existing_user.email = email
+        existing_user.avatar_url = avatar_url
+        user = existing_user
+    else:
+        # ユーザー名の重複チェック
+        username_exists = await db.scalar(
+            select(User.id).where(User.username == username)
+        )
+        if username_exists:
+            # ユーザー名が重複している場合、Discord IDをサフィックスとして追加
+            username = f"{username}_{discord_id[:8]}"
+        
+        # 新規ユーザー作成
+        user = User(
+            username=username,
+            email=email,
+            discord_id=discord_id,
+            auth_provider=AuthProvider.DISCORD,
+            avatar_url=avatar_url
+        )
+        db.add(user)
+    
+    await db.commit()
+    await db.refresh(user)
+    # ユーザー名・アバター等の変更をキャッシュ済みのユーザー情報に反映
+    principal_cache.invalidate(user.id)
+    # 一覧にはユーザー名を含めてキャッシュしているため、変更された場合は削除する
+    if username_changed:
+        fixed_point_list_cache.clear()
+    
+    # JWTトークンの生成（リフレッシュトークンはハッシュをデータベースに保存）
+    tokens = await AuthService.issue_tokens(db, user)
+    
+    # フロントエンドにリダイレクト（トークンをクエリパラメータで渡す）
+    frontend_url = f"{settings.FRONTEND_URL}/auth/callback?access_token={tokens.access_token}&refresh_token={tokens.refresh_token}"
+    
+    return RedirectResponse(url=frontend_url)
 
 @router.post("/revoke")
 async def revoke_discord_token(
     discord_token: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Discord OAuth トークンの取り消し"""
     if not settings.DISCORD_CLIENT_ID or not settings.DISCORD_CLIENT_SECRET:
         raise HTTPException(status_code=500, detail="Discord OAuth is not configured")
     
-    async with httpx.AsyncClient() as client:
-        revoke_response = await client.post(
-            "https://discord.com/api/oauth2/token/revoke",
-            data={
-                "client_id": settings.DISCORD_CLIENT_ID,
-                "client_secret": settings.DISCORD_CLIENT_SECRET,
-                "token": discord_token
-            },
-            headers={"Content-Type": "application/x-www-form-urlencoded"}
-        )
-        
-        if revoke_response.status_code != 200:
-            raise HTTPException(status_code=400, detail="Failed to revoke token")
+    client = http_clients.get("discord")
+    revoke_response = await client.post(
+        "/oauth2/token/revoke",
+        data={
+            "client_id": settings.DISCORD_CLIENT_ID,
+            "client_secret": settings.DISCORD_CLIENT_SECRET,
+            "token": discord_token
+        },
+        headers={"Content-Type": "application/x-www-form-urlencoded"}
+    )
+    
+    if revoke_response.status_code != 200:
+        raise HTTPException(status_code=400, detail="Failed to revoke token")
     
     return {"message": "Token revoked successfully"}
\ No newline at end of file
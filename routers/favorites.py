@@ -1,14 +1,17 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
-from datetime import datetime
 
-from core.database import get_db
-from core.security import get_current_user
-from models.user import User
+from core.database import get_async_db
+from core.security import credentials_exception, get_current_user_claims
 from models.favorite import Favorite
 from models.fixed_point import FixedPoint
+from models.user import User
+from schemas.auth import TokenData
 from schemas.favorite import FavoriteResponse, FavoriteCreate
+from services.fixed_point_cache import fixed_point_list_cache
 
 router = APIRouter(prefix="/api/favorites", tags=["favorites"])
 
@@ -16,12 +19,12 @@ router = APIRouter(prefix="/api/favorites", tags=["favorites"])
 @router.post("/", response_model=FavoriteResponse, status_code=status.HTTP_201_CREATED)
 async def add_favorite(
     favorite_data: FavoriteCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    claims: TokenData = Depends(get_current_user_claims)
 ):
     """お気に入りを追加"""
     # 定点が存在するかチェック
-    fixed_point = db.query(FixedPoint).filter(FixedPoint.id == favorite_data.fixed_point_id).first()
+    fixed_point = await db.get(FixedPoint, favorite_data.fixed_point_id)
     if not fixed_point:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -29,10 +32,12 @@ async def add_favorite(
         )
     
     # 既にお気に入りに追加されているかチェック
-    existing_favorite = db.query(Favorite).filter(
-        Favorite.user_id == current_user.id,
-        Favorite.fixed_point_id == favorite_data.fixed_point_id
-    ).first()
+    existing_favorite = await db.scalar(
+        select(Favorite).where(
+            Favorite.user_id == claims.user_id,
+            Favorite.fixed_point_id == favorite_data.fixed_point_id
+        )
+    )
     
     if existing_favorite:
         raise HTTPException(
@@ -42,13 +47,46 @@ async def add_favorite(
     
     # お気に入りを作成
     favorite = Favorite(
-        user_id=current_user.id,
+        user_id=claims.user_id,
         fixed_point_id=favorite_data.fixed_point_id
     )
     
     db.add(favorite)
-    db.commit()
-    db.refresh(favorite)
+    try:
+        # お気に入り数を同じトランザクション内で加算
+        await db.execute(
+            update(FixedPoint)
+            .where(FixedPoint.id == favorite_data.fixed_point_id)
+            .values(
+                favorites_count=FixedPoint.favorites_count + 1,
+                # onupdate による updated_at の更新を抑止（お気に入りは定点の編集ではない）
+                updated_at=FixedPoint.updated_at
+            )
+        )
+        await db.commit()
+    except IntegrityError:
+        # クレームだけで認証しているため、トークンの発行後に削除されたユーザーや
+        # チェック後に削除された定点、同時の追加はここで制約違反になる
+        await db.rollback()
+        if await db.get(User, claims.user_id) is None:
+            raise credentials_exception()
+        if await db.get(FixedPoint, favorite_data.fixed_point_id) is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Fixed point not found"
+            )
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Already favorited"
+        )
+    await db.refresh(favorite)
+    
+    # お気に入り数が変わった定点を含む一覧のキャッシュを削除
+    fixed_point_list_cache.invalidate(
+        map_id=fixed_point.map_id,
+        character_id=fixed_point.character_id,
+        user_id=fixed_point.user_id
+    )
     
     return favorite
 
@@ -56,14 +94,16 @@ async def add_favorite(
 @router.delete("/{fixed_point_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def remove_favorite(
     fixed_point_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    claims: TokenData = Depends(get_current_user_claims)
 ):
     """お気に入りを削除"""
-    favorite = db.query(Favorite).filter(
-        Favorite.user_id == current_user.id,
-        Favorite.fixed_point_id == fixed_point_id
-    ).first()
+    favorite = await db.scalar(
+        select(Favorite).where(
+            Favorite.user_id == claims.user_id,
+            Favorite.fixed_point_id == fixed_point_id
+        )
+    )
     
     if not favorite:
         raise HTTPException(
@@ -71,19 +111,39 @@ async def remove_favorite(
             detail="Favorite not found"
         )
     
-    db.delete(favorite)
-    db.commit()
+    await db.delete(favorite)
+    # お気に入り数を同じトランザクション内で減算
+    fixed_point = (await db.execute(
+        update(FixedPoint)
+        .where(FixedPoint.id == fixed_point_id)
+        .values(
+            favorites_count=FixedPoint.favorites_count - 1,
+            # onupdate による updated_at の更新を抑止（お気に入りは定点の編集ではない）
+            updated_at=FixedPoint.updated_at
+        )
+        .returning(FixedPoint.map_id, FixedPoint.character_id, FixedPoint.user_id)
+    )).one()
+    await db.commit()
+    
+    # お気に入り数が変わった定点を含む一覧のキャッシュを削除
+    fixed_point_list_cache.invalidate(
+        map_id=fixed_point.map_id,
+        character_id=fixed_point.character_id,
+        user_id=fixed_point.user_id
+    )
 
 
 @router.get("/", response_model=List[FavoriteResponse])
 async def get_my_favorites(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    claims: TokenData = Depends(get_current_user_claims)
 ):
     """自分のお気に入り一覧を取得"""
-    favorites = db.query(Favorite).filter(
-        Favorite.user_id == current_user.id
-    ).order_by(Favorite.created_at.desc()).all()
+    favorites = (await db.scalars(
+        select(Favorite).where(
+            Favorite.user_id == claims.user_id
+        ).order_by(Favorite.created_at.desc())
+    )).all()
     
     return favorites
 
@@ -91,13 +151,15 @@ async def get_my_favorites(
 @router.get("/check/{fixed_point_id}")
 async def check_favorite_status(
     fixed_point_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    claims: TokenData = Depends(get_current_user_claims)
 ):
     """特定の定点のお気に入り状態をチェック"""
-    favorite = db.query(Favorite).filter(
-        Favorite.user_id == current_user.id,
-        Favorite.fixed_point_id == fixed_point_id
-    ).first()
+    favorite = await db.scalar(
+        select(Favorite).where(
+            Favorite.user_id == claims.user_id,
+            Favorite.fixed_point_id == fixed_point_id
+        )
+    )
     
-    return {"is_favorited": favorite is not None}
\ No newline at end of file
+    return {"is_favorited": favorite is not None}
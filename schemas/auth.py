@@ -28,6 +28,11 @@ class Token(BaseModel):
     token_type: str = "bearer"
 
 
+class RefreshTokenRequest(BaseModel):
+    """トークン再発行リクエスト"""
+    refresh_token: str
+
+
 class TokenData(BaseModel):
     """トークンペイロードデータ"""
     user_id: int
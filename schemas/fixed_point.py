@@ -83,4 +83,19 @@ class FixedPointListResponse(BaseModel):
     username: str
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+
+class FixedPointImportError(BaseModel):
+    """一括インポートで登録できなかった行"""
+    line: int = Field(..., description="NDJSONの行番号（1始まり）")
+    error: str
+
+
+class FixedPointImportResponse(BaseModel):
+    """一括インポートの結果"""
+    imported: int
+    failed: int
+    errors: List[FixedPointImportError] = Field(..., description="失敗した行（先頭から FIXED_POINT_IMPORT_MAX_ERRORS 件まで）")
+    elapsed_seconds: float
+    records_per_second: float
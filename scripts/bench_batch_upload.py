@@ -0,0 +1,109 @@
+"""一括アップロードの逐次処理と並行処理のレイテンシを比較するベンチマーク
+
+1〜5枚の画像（ゲームのスクリーンショット相当のサイズ）を、
+1枚ずつ保存した場合と store_images で並行して保存した場合の所要時間を計測する。
+画像は一時ディレクトリに保存され、データベースは使用しない。
+
+使い方:
+    uv run python scripts/bench_batch_upload.py [--rounds 5] [--width 1920] [--height 1080]
+"""
+import argparse
+import asyncio
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# アップロード先（相対パスの uploads/）を一時ディレクトリにするため、インポート前に移動する
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(REPO_ROOT))
+os.chdir(tempfile.mkdtemp(prefix="bench_batch_upload_"))
+
+from fastapi import UploadFile
+from PIL import Image
+from starlette.datastructures import Headers
+
+from api.upload import UPLOAD_DIR, store_image, store_images
+from services.image_processing import image_processing_service
+
+
+def make_screenshot(width: int, height: int, seed: int) -> bytes:
+    """スクリーンショット相当のJPEG画像を生成（ノイズを含めて圧縮率を実際に近づける）"""
+    noise = Image.effect_noise((width, height), 40 + seed).convert("RGB")
+    gradient = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    image = Image.blend(noise, gradient, 0.5)
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def to_upload_files(images: list) -> list:
+    return [
+        UploadFile(
+            file=io.BytesIO(data),
+            size=len(data),
+            filename=f"step{i + 1}.jpg",
+            headers=Headers({"content-type": "image/jpeg"})
+        )
+        for i, data in enumerate(images)
+    ]
+
+
+async def run_sequential(images: list) -> float:
+    started_at = time.perf_counter()
+    for file in to_upload_files(images):
+        await store_image(file)
+    return time.perf_counter() - started_at
+
+
+async def run_parallel(images: list) -> float:
+    started_at = time.perf_counter()
+    await store_images(to_upload_files(images))
+    return time.perf_counter() - started_at
+
+
+def clear_uploads() -> None:
+    for entry in os.scandir(UPLOAD_DIR):
+        if entry.is_file():
+            os.remove(entry.path)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="一括アップロードのベンチマーク")
+    parser.add_argument("--rounds", type=int, default=5, help="各ケースの計測回数")
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    args = parser.parse_args()
+    
+    images = [make_screenshot(args.width, args.height, seed) for seed in range(5)]
+    average_size = sum(map(len, images)) / len(images) / 1024 / 1024
+    print(
+        f"{args.width}x{args.height} JPEG, avg {average_size:.2f}MB, {args.rounds} rounds, "
+        f"{image_processing_service.executor_type} pool x{image_processing_service.max_workers}"
+    )
+    
+    # ワーカープールの起動コストを計測から除外する
+    await run_parallel(images[:1])
+    clear_uploads()
+    
+    print(f"{'files':>5} {'sequential (ms)':>16} {'parallel (ms)':>14} {'speedup':>8}")
+    for count in range(1, 6):
+        sequential, parallel = [], []
+        for _ in range(args.rounds):
+            sequential.append(await run_sequential(images[:count]))
+            clear_uploads()
+            parallel.append(await run_parallel(images[:count]))
+            clear_uploads()
+        
+        sequential_ms = statistics.median(sequential) * 1000
+        parallel_ms = statistics.median(parallel) * 1000
+        print(f"{count:>5} {sequential_ms:>16.1f} {parallel_ms:>14.1f} {sequential_ms / parallel_ms:>7.2f}x")
+    
+    image_processing_service.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,205 @@
+"""定点一覧などの主要クエリがインデックスで絞り込み・並び替えできることを確認する
+
+テスト用のデータをトランザクション内で投入して EXPLAIN を実行し、
+最後にロールバックするため、開発用データベースに対しても実行できる。
+いずれかのクエリが Seq Scan または Sort（絞り込んだ後の並び替え）にフォールバックした場合は
+終了コード1で終了する。tests/test_query_plans.py からも実行される。
+
+使い方:
+    uv run alembic upgrade head
+    uv run python scripts/check_query_plans.py [--verbose]
+"""
+import argparse
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import select, insert, text
+from sqlalchemy.engine import Connection
+
+from core.database import engine
+import models  # これにより全てのモデルが登録される
+from models.user import User, AuthProvider
+from models.fixed_point import FixedPoint, FixedPointStep
+from models.favorite import Favorite
+from api.fixed_points import build_fixed_point_list_query, build_favorited_ids_query
+
+SEED_USERS = 200
+SEED_FIXED_POINTS = 5000
+MAP_IDS = [f"map-{i}" for i in range(10)]
+CHARACTER_IDS = [f"agent-{i}" for i in range(20)]
+CHECKED_TABLES = ("users", "fixed_points", "fixed_point_steps", "favorites")
+
+
+def seed(conn: Connection) -> None:
+    """EXPLAIN用のデータを投入"""
+    now = datetime.now(timezone.utc)
+    user_ids = conn.execute(
+        insert(User).returning(User.id),
+        [
+            {
+                "username": f"plan_check_{i}",
+                "email": f"plan_check_{i}@example.com",
+                "auth_provider": AuthProvider.EMAIL,
+            }
+            for i in range(SEED_USERS)
+        ]
+    ).scalars().all()
+    
+    fixed_point_ids = conn.execute(
+        insert(FixedPoint).returning(FixedPoint.id),
+        [
+            {
+                "user_id": user_ids[i % len(user_ids)],
+                "title": f"plan check {i}",
+                "map_id": MAP_IDS[i % len(MAP_IDS)],
+                "character_id": CHARACTER_IDS[i % len(CHARACTER_IDS)],
+                "favorites_count": i % 50,
+                "created_at": now - timedelta(minutes=i),
+            }
+            for i in range(SEED_FIXED_POINTS)
+        ]
+    ).scalars().all()
+    
+    conn.execute(
+        insert(FixedPointStep),
+        [
+            {"fixed_point_id": fixed_point_id, "step_order": step_order}
+            for fixed_point_id in fixed_point_ids
+            for step_order in (1, 2, 3)
+        ]
+    )
+    conn.execute(
+        insert(Favorite),
+        [
+            {"user_id": user_id, "fixed_point_id": fixed_point_ids[(j * 37 + k) % len(fixed_point_ids)]}
+            for j, user_id in enumerate(user_ids)
+            for k in range(10)
+        ]
+    )
+    
+    for table in CHECKED_TABLES:
+        conn.execute(text(f"ANALYZE {table}"))
+
+
+def query_shapes(conn: Connection) -> dict:
+    """確認対象のクエリ一覧"""
+    user_id = conn.scalar(select(User.id).where(User.username == "plan_check_0"))
+    fixed_point_id, created_at = conn.execute(
+        select(FixedPoint.id, FixedPoint.created_at)
+        .where(FixedPoint.title == "plan check 100")
+    ).one()
+    map_id, character_id = MAP_IDS[0], CHARACTER_IDS[0]
+    
+    def list_page(**filters):
+        # エンドポイントと同様に1ページ分（limit + 1件）を取得する
+        return build_fixed_point_list_query(**filters).limit(21)
+    
+    return {
+        "list newest": list_page(),
+        "list newest by map": list_page(map_id=map_id),
+        "list newest by agent": list_page(character_id=character_id),
+        "list newest by map + agent": list_page(map_id=map_id, character_id=character_id),
+        "list newest by map + agent (cursor)": list_page(
+            map_id=map_id, character_id=character_id, after=(created_at, fixed_point_id)
+        ),
+        "list newest by user": list_page(user_id=user_id),
+        "list newest favorited by": list_page(favorited_by=user_id),
+        "list popular": list_page(sort="popular"),
+        "list popular by map": list_page(sort="popular", map_id=map_id),
+        "list popular by agent": list_page(sort="popular", character_id=character_id),
+        "list popular by map + agent": list_page(
+            sort="popular", map_id=map_id, character_id=character_id
+        ),
+        "list popular by user": list_page(sort="popular", user_id=user_id),
+        "favorited overlay": build_favorited_ids_query(
+            user_id, [fixed_point_id + offset for offset in range(20)]
+        ),
+        "detail steps": select(FixedPointStep)
+            .where(FixedPointStep.fixed_point_id == fixed_point_id)
+            .order_by(FixedPointStep.step_order),
+        "my favorites": select(Favorite)
+            .where(Favorite.user_id == user_id)
+            .order_by(Favorite.created_at.desc()),
+        "favorites by fixed point": select(Favorite.id)
+            .where(Favorite.fixed_point_id == fixed_point_id),
+    }
+
+
+def explain(conn: Connection, query) -> list:
+    """EXPLAINの結果を行のリストで返す"""
+    compiled = query.compile(dialect=conn.dialect, compile_kwargs={"render_postcompile": True})
+    return [row[0] for row in conn.exec_driver_sql("EXPLAIN " + str(compiled), compiled.params)]
+
+
+def find_fallbacks(plan: list) -> list:
+    """実行計画のうち、インデックスで絞り込み・並び替えできていない行
+    
+    - Seq Scan
+    - Sort（インデックスの順序で取得できず、絞り込んだ後に並び替えている）
+    - fixed_points のインデックススキャンの Filter（並び順のインデックスを先頭から読みながら
+      条件に合わない行を捨てている。一覧の絞り込み条件は全てインデックスの条件になる必要がある）
+    """
+    fallbacks = []
+    node = ""
+    for line in plan:
+        stripped = line.strip().removeprefix("->  ")
+        if "(cost=" in line:
+            node = stripped
+        if "Seq Scan" in line and any(f" on {table}" in line for table in CHECKED_TABLES):
+            fallbacks.append(stripped)
+        elif "Sort  (" in line:
+            fallbacks.append(stripped)
+        elif stripped.startswith("Filter:") and "Index" in node and " on fixed_points " in node:
+            fallbacks.append(f"{node} / {stripped}")
+    return fallbacks
+
+
+def check_query_plans(conn: Connection) -> Dict[str, List[str]]:
+    """テスト用のデータを投入して全てのクエリの実行計画を取得する（呼び出し側でロールバックする）
+    
+    Returns:
+        クエリ名 -> 実行計画の行
+    """
+    seed(conn)
+    # インデックスが使える場合は必ず選ばれるようにする
+    # （それでもSeq Scan・Sortになる場合は該当するインデックスが存在しない）
+    conn.execute(text("SET LOCAL enable_seqscan = off"))
+    conn.execute(text("SET LOCAL enable_sort = off"))
+    return {name: explain(conn, query) for name, query in query_shapes(conn).items()}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="主要クエリの実行計画を確認")
+    parser.add_argument("--verbose", action="store_true", help="全ての実行計画を表示")
+    args = parser.parse_args()
+    
+    failures = []
+    with engine.connect() as conn:
+        transaction = conn.begin()
+        try:
+            plans = check_query_plans(conn)
+        finally:
+            transaction.rollback()
+    
+    for name, plan in plans.items():
+        fallbacks = find_fallbacks(plan)
+        status = "FAIL" if fallbacks else "ok"
+        print(f"[{status}] {name}")
+        if fallbacks or args.verbose:
+            for line in plan:
+                print(f"    {line}")
+        if fallbacks:
+            failures.append(name)
+    
+    if failures:
+        print(f"\n{len(failures)} query shape(s) fell back to a sequential scan or sort: {', '.join(failures)}")
+        sys.exit(1)
+    print("\nAll query shapes use indexes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""どの定点のステップからも参照されていないアップロード画像を削除する
+
+アップロード画像は内容のSHA-256ハッシュで保存され、同じ内容は1つのファイルを共有するため、
+fixed_point_steps.image_url からの参照を集計して、参照が残っていないファイルと派生画像を削除する。
+アップロード直後でまだ定点に紐付けられていない画像を消さないよう、
+更新から --min-age-hours 時間以内のファイルは対象外にする。
+
+使い方:
+    uv run python scripts/gc_uploads.py [--dry-run] [--min-age-hours 24]
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Set, Tuple
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import select
+
+from api.upload import UPLOAD_DIR, UPLOAD_URL_PREFIX, get_variant_path
+from core.database import SessionLocal
+import models  # これにより全てのモデルが登録される
+from models.fixed_point import FixedPointStep
+from services.image_processing import VARIANT_SIZES
+
+
+def get_referenced_filenames() -> Set[str]:
+    """ステップの image_url から参照されているアップロード画像のファイル名"""
+    db = SessionLocal()
+    try:
+        image_urls = db.scalars(
+            select(FixedPointStep.image_url).where(
+                FixedPointStep.image_url.contains(UPLOAD_URL_PREFIX)
+            ).distinct()
+        )
+        referenced = set()
+        for image_url in image_urls:
+            # ホスト名付きのURLやクエリパラメータ付きのURLも扱う
+            filename = image_url.split(UPLOAD_URL_PREFIX, 1)[1]
+            referenced.add(filename.split("?", 1)[0].split("#", 1)[0])
+        return referenced
+    finally:
+        db.close()
+
+
+def gc_uploads(min_age_hours: float = 24, dry_run: bool = False) -> Tuple[int, int]:
+    """参照されていないアップロード画像を削除し、(削除したファイル数, 解放したバイト数) を返す"""
+    referenced = get_referenced_filenames()
+    cutoff = time.time() - min_age_hours * 3600
+    
+    removed_files = 0
+    freed_bytes = 0
+    for entry in os.scandir(UPLOAD_DIR):
+        if not entry.is_file() or entry.name in referenced:
+            continue
+        stat = entry.stat()
+        if stat.st_mtime > cutoff:
+            continue
+        
+        # 中断されたアップロードの一時ファイル（.part）には派生画像がない
+        paths = [entry.path]
+        if not entry.name.startswith("."):
+            paths += [get_variant_path(entry.name, size) for size in VARIANT_SIZES]
+        
+        for path in paths:
+            try:
+                size = os.path.getsize(path)
+                if not dry_run:
+                    os.remove(path)
+            except FileNotFoundError:
+                continue
+            removed_files += 1
+            freed_bytes += size
+    
+    return removed_files, freed_bytes
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="参照されていないアップロード画像を削除")
+    parser.add_argument("--dry-run", action="store_true", help="対象の確認のみ行い、削除しない")
+    parser.add_argument(
+        "--min-age-hours",
+        type=float,
+        default=24,
+        help="この時間以内に更新されたファイルは削除しない（デフォルト: 24）"
+    )
+    args = parser.parse_args()
+    
+    removed_files, freed_bytes = gc_uploads(min_age_hours=args.min_age_hours, dry_run=args.dry_run)
+    freed_mb = freed_bytes / 1024 / 1024
+    if args.dry_run:
+        print(f"{removed_files} unreferenced file(s) ({freed_mb:.1f}MB) would be removed")
+    else:
+        print(f"Removed {removed_files} unreferenced file(s) ({freed_mb:.1f}MB)")
+
+
+if __name__ == "__main__":
+    main()
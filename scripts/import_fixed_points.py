@@ -0,0 +1,76 @@
+"""NDJSONファイルから定点を一括登録する
+
+1行に1件、POST /api/fixed-points/ と同じ形式（FixedPointCreate）のJSONを書いたファイルを読み込み、
+指定したユーザーの定点としてまとめて登録する。
+エラーになった行は行番号と内容を表示し、最後に登録件数とスループット（records/sec）を表示する。
+
+使い方:
+    uv run python scripts/import_fixed_points.py fixed_points.ndjson --user-id 1 [--chunk-size 500]
+"""
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import aiofiles
+
+from core.config import settings
+from core.database import AsyncSessionLocal, async_engine
+import models  # これにより全てのモデルが登録される
+from models.user import User
+from services.fixed_point_import import import_fixed_points
+
+READ_CHUNK_SIZE = 64 * 1024
+
+
+async def read_chunks(path: Path):
+    async with aiofiles.open(path, "rb") as f:
+        while chunk := await f.read(READ_CHUNK_SIZE):
+            yield chunk
+
+
+async def run(path: Path, user_id: int, chunk_size: int) -> int:
+    try:
+        async with AsyncSessionLocal() as db:
+            if await db.get(User, user_id) is None:
+                print(f"User {user_id} not found", file=sys.stderr)
+                return 1
+            
+            result = await import_fixed_points(
+                db,
+                user_id,
+                read_chunks(path),
+                chunk_size=chunk_size,
+                max_errors=sys.maxsize
+            )
+    finally:
+        await async_engine.dispose()
+    
+    for error in result.errors:
+        print(f"line {error.line}: {error.error}", file=sys.stderr)
+    print(
+        f"Imported {result.imported} fixed point(s), {result.failed} failed "
+        f"in {result.elapsed_seconds:.2f}s ({result.records_per_second:.1f} records/sec)"
+    )
+    return 1 if result.failed else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="NDJSONファイルから定点を一括登録")
+    parser.add_argument("path", type=Path, help="1行に1件の定点を書いたNDJSONファイル")
+    parser.add_argument("--user-id", type=int, required=True, help="登録する定点の作成者")
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=settings.FIXED_POINT_IMPORT_CHUNK_SIZE,
+        help="1トランザクションで登録する定点数"
+    )
+    args = parser.parse_args()
+    
+    sys.exit(asyncio.run(run(args.path, args.user_id, args.chunk_size)))
+
+
+if __name__ == "__main__":
+    main()
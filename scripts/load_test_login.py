@@ -0,0 +1,121 @@
+"""ログインの集中が他のエンドポイントのレイテンシに与える影響を計測する負荷試験
+
+起動中のサーバーに対して、ログインを大量に同時送信している間に
+bcryptを使わないエンドポイント（デフォルトは /）を一定間隔で呼び出し、
+平常時とログイン集中時のレイテンシ（p50 / p99）を比較する。
+bcryptがイベントループ上で実行されていると、集中時のp99がbcrypt数回分まで悪化する。
+
+使い方:
+    uv run uvicorn main:app --port 8000
+    uv run python scripts/load_test_login.py [--base-url http://localhost:8000] [--logins 200] [--concurrency 50]
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+from typing import List
+
+import httpx
+
+
+def percentile(samples: List[float], ratio: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * ratio))]
+
+
+def summarize(label: str, samples: List[float]) -> None:
+    if not samples:
+        print(f"{label:>8}: no samples")
+        return
+    print(
+        f"{label:>8}: n={len(samples):<5} "
+        f"p50={statistics.median(samples) * 1000:8.1f}ms "
+        f"p99={percentile(samples, 0.99) * 1000:8.1f}ms "
+        f"max={max(samples) * 1000:8.1f}ms"
+    )
+
+
+async def probe(client: httpx.AsyncClient, path: str, stop: asyncio.Event, interval: float) -> List[float]:
+    """stop がセットされるまで path を一定間隔で呼び出し、レイテンシを記録"""
+    samples = []
+    while not stop.is_set():
+        started_at = time.perf_counter()
+        response = await client.get(path)
+        samples.append(time.perf_counter() - started_at)
+        response.raise_for_status()
+        await asyncio.sleep(interval)
+    return samples
+
+
+async def login_burst(
+    client: httpx.AsyncClient, email: str, password: str, logins: int, concurrency: int
+) -> dict:
+    """ログインを concurrency 件ずつ同時に送信し、ステータスコードごとの件数を返す"""
+    semaphore = asyncio.Semaphore(concurrency)
+    status_counts: dict = {}
+    
+    async def login() -> None:
+        async with semaphore:
+            response = await client.post(
+                "/api/auth/login", json={"email": email, "password": password}
+            )
+            status_counts[response.status_code] = status_counts.get(response.status_code, 0) + 1
+    
+    await asyncio.gather(*[login() for _ in range(logins)])
+    return status_counts
+
+
+async def measure_probe(client: httpx.AsyncClient, path: str, seconds: float, interval: float) -> List[float]:
+    stop = asyncio.Event()
+    task = asyncio.create_task(probe(client, path, stop, interval))
+    await asyncio.sleep(seconds)
+    stop.set()
+    return await task
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="ログイン集中時のレイテンシを計測")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--probe-path", default="/", help="レイテンシを計測するエンドポイント")
+    parser.add_argument("--logins", type=int, default=200, help="送信するログインの件数")
+    parser.add_argument("--concurrency", type=int, default=50, help="同時に送信するログインの件数")
+    parser.add_argument("--baseline-seconds", type=float, default=3.0, help="平常時の計測時間")
+    parser.add_argument("--probe-interval", type=float, default=0.01)
+    args = parser.parse_args()
+    
+    limits = httpx.Limits(max_connections=args.concurrency + 10)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=120, limits=limits) as client:
+        # 計測用のユーザーを作成
+        suffix = uuid.uuid4().hex[:8]
+        email = f"loadtest-{suffix}@example.com"
+        password = "loadtest-password"
+        response = await client.post(
+            "/api/auth/register",
+            json={"username": f"loadtest_{suffix}", "email": email, "password": password}
+        )
+        response.raise_for_status()
+        
+        baseline = await measure_probe(
+            client, args.probe_path, args.baseline_seconds, args.probe_interval
+        )
+        
+        stop = asyncio.Event()
+        probe_task = asyncio.create_task(probe(client, args.probe_path, stop, args.probe_interval))
+        started_at = time.perf_counter()
+        status_counts = await login_burst(client, email, password, args.logins, args.concurrency)
+        burst_seconds = time.perf_counter() - started_at
+        stop.set()
+        during_burst = await probe_task
+    
+    print(
+        f"{args.logins} logins (concurrency {args.concurrency}) in {burst_seconds:.1f}s, "
+        f"status codes: {dict(sorted(status_counts.items()))}"
+    )
+    print(f"latency of GET {args.probe_path}:")
+    summarize("baseline", baseline)
+    summarize("burst", during_burst)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,60 @@
+"""fixed_points.favorites_count を favorites テーブルの実件数に合わせて修正する
+
+使い方:
+    uv run python scripts/reconcile_favorites_count.py [--dry-run]
+"""
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import select, update, func
+
+from core.database import SessionLocal
+import models  # これにより全てのモデルが登録される
+from models.fixed_point import FixedPoint
+from models.favorite import Favorite
+
+
+def reconcile_favorites_count(dry_run: bool = False) -> int:
+    """ずれている favorites_count を修正し、修正した行数を返す"""
+    actual_count = select(func.count(Favorite.id)).where(
+        Favorite.fixed_point_id == FixedPoint.id
+    ).correlate(FixedPoint).scalar_subquery()
+    
+    db = SessionLocal()
+    try:
+        if dry_run:
+            return db.scalar(
+                select(func.count(FixedPoint.id)).where(
+                    FixedPoint.favorites_count != actual_count
+                )
+            )
+        
+        result = db.execute(
+            update(FixedPoint)
+            .where(FixedPoint.favorites_count != actual_count)
+            .values(favorites_count=actual_count, updated_at=FixedPoint.updated_at)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        return result.rowcount
+    finally:
+        db.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="favorites_count のずれを修正")
+    parser.add_argument("--dry-run", action="store_true", help="件数の確認のみ行い、更新しない")
+    args = parser.parse_args()
+    
+    drifted = reconcile_favorites_count(dry_run=args.dry_run)
+    if args.dry_run:
+        print(f"{drifted} fixed point(s) have a drifted favorites_count")
+    else:
+        print(f"Reconciled favorites_count for {drifted} fixed point(s)")
+
+
+if __name__ == "__main__":
+    main()
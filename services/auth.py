@@ -1,33 +1,148 @@
 """認証サービス"""
-from datetime import datetime, timedelta
-from typing import Optional
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Optional, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from sqlalchemy.orm import Session
-from sqlalchemy import or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import delete, func, select, or_
 import secrets
+import logging
 
 from core.config import settings
+from core.database import AsyncSessionLocal
 from models.user import User, AuthProvider
 from models.auth_token import AuthToken
-from schemas.auth import TokenData
+from schemas.auth import Token, TokenData
 
-# パスワードハッシュ化の設定
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+logger = logging.getLogger(__name__)
+
+# パスワードハッシュ化の設定（ラウンド数が設定と異なるハッシュは再ハッシュの対象になる）
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=settings.BCRYPT_ROUNDS
+)
+
+
+class PasswordHashingBusyError(Exception):
+    """空きワーカーを待つ時間が上限を超えた"""
+    pass
+
+
+class PasswordHasher:
+    """bcrypt（意図的に遅い処理）をイベントループの外の専用スレッドプールで実行する
+    
+    同時実行数は max_workers に制限し、空きを queue_timeout 秒以上待つ場合は
+    PasswordHashingBusyError を送出する（ログインが集中しても他のリクエストを止めない）。
+    """
+    
+    def __init__(self, max_workers: int, queue_timeout: float):
+        self.max_workers = max_workers
+        self.queue_timeout = queue_timeout
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._semaphore = asyncio.Semaphore(max_workers)
+    
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix="password-hash"
+            )
+        return self._executor
+    
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise PasswordHashingBusyError("Timed out waiting for a password hashing worker")
+        
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), func, *args)
+        finally:
+            self._semaphore.release()
+    
+    async def hash(self, password: str) -> str:
+        return await self.run(pwd_context.hash, password)
+    
+    async def verify_and_update(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """パスワードを検証し、再ハッシュが必要な場合は新しいハッシュも返す"""
+        return await self.run(pwd_context.verify_and_update, password, hashed_password)
+    
+    def shutdown(self) -> None:
+        """スレッドプールを終了（アプリケーション終了時）"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# シングルトンインスタンス
+password_hasher = PasswordHasher(
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    queue_timeout=settings.PASSWORD_HASH_QUEUE_TIMEOUT_SECONDS
+)
+
+
+class PrincipalCache:
+    """認証済みユーザー（セッションから切り離したUser）をユーザーIDごとにキャッシュする
+    
+    エントリは ttl_seconds 秒で期限切れになり、max_size を超えると古いものから削除する。
+    ユーザー情報を更新した場合は invalidate を呼ぶこと。
+    """
+    
+    def __init__(self, ttl_seconds: float, max_size: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self._entries: "OrderedDict[int, Tuple[float, User]]" = OrderedDict()
+    
+    def get(self, user_id: int) -> Optional[User]:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        cached_at, user = entry
+        if time.monotonic() - cached_at > self.ttl_seconds:
+            del self._entries[user_id]
+            return None
+        self._entries.move_to_end(user_id)
+        return user
+    
+    def set(self, user: User) -> None:
+        self._entries[user.id] = (time.monotonic(), user)
+        self._entries.move_to_end(user.id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+    
+    def invalidate(self, user_id: int) -> None:
+        self._entries.pop(user_id, None)
+    
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+# シングルトンインスタンス
+principal_cache = PrincipalCache(
+    ttl_seconds=settings.PRINCIPAL_CACHE_TTL_SECONDS,
+    max_size=settings.PRINCIPAL_CACHE_MAX_SIZE
+)
 
 
 class AuthService:
     """認証関連の処理を管理するサービス"""
     
     @staticmethod
-    def verify_password(plain_password: str, hashed_password: str) -> bool:
-        """パスワードの検証"""
-        return pwd_context.verify(plain_password, hashed_password)
+    async def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """パスワードの検証（再ハッシュが必要な場合は新しいハッシュも返す）"""
+        return await password_hasher.verify_and_update(plain_password, hashed_password)
     
     @staticmethod
-    def get_password_hash(password: str) -> str:
+    async def get_password_hash(password: str) -> str:
         """パスワードのハッシュ化"""
-        return pwd_context.hash(password)
+        return await password_hasher.hash(password)
     
     @staticmethod
     def create_access_token(data: dict) -> str:
@@ -40,18 +155,25 @@ class AuthService:
     
     @staticmethod
     def create_refresh_token(data: dict) -> str:
-        """リフレッシュトークンの作成"""
+        """リフレッシュトークンの作成（同じ内容でも毎回異なるトークンになるよう jti を含める）"""
         to_encode = data.copy()
         expire = datetime.utcnow() + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
-        to_encode.update({"exp": expire, "type": "refresh"})
+        to_encode.update({"exp": expire, "type": "refresh", "jti": secrets.token_urlsafe(16)})
         encoded_jwt = jwt.encode(to_encode, settings.JWT_SECRET, algorithm=settings.JWT_ALGORITHM)
         return encoded_jwt
     
     @staticmethod
-    def decode_token(token: str) -> Optional[TokenData]:
-        """トークンのデコード"""
+    def hash_refresh_token(refresh_token: str) -> str:
+        """DBに保存するリフレッシュトークンのハッシュ"""
+        return hashlib.sha256(refresh_token.encode()).hexdigest()
+    
+    @staticmethod
+    def decode_token(token: str, token_type: str = "access") -> Optional[TokenData]:
+        """トークンのデコード（種類が token_type と異なるトークンは無効とする）"""
         try:
             payload = jwt.decode(token, settings.JWT_SECRET, algorithms=[settings.JWT_ALGORITHM])
+            if payload.get("type") != token_type:
+                return None
             user_id: int = payload.get("user_id")
             username: str = payload.get("username")
             email: str = payload.get("email")
@@ -62,22 +184,103 @@ class AuthService:
             return None
     
     @staticmethod
-    def authenticate_user(db: Session, email: str, password: str) -> Optional[User]:
+    async def issue_tokens(db: AsyncSession, user: User) -> Token:
+        """アクセストークンとリフレッシュトークンを発行（リフレッシュトークンはハッシュをDBに保存してコミット）"""
+        token_data = {
+            "user_id": user.id,
+            "username": user.username,
+            "email": user.email
+        }
+        access_token = AuthService.create_access_token(token_data)
+        refresh_token = AuthService.create_refresh_token(token_data)
+        
+        db.add(AuthToken(
+            user_id=user.id,
+            token_hash=AuthService.hash_refresh_token(refresh_token),
+            expires_at=datetime.now(timezone.utc) + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
+        ))
+        await db.commit()
+        
+        return Token(
+            access_token=access_token,
+            refresh_token=refresh_token
+        )
+    
+    @staticmethod
+    async def rotate_refresh_token(db: AsyncSession, refresh_token: str) -> Optional[Token]:
+        """リフレッシュトークンを使用済みにして新しいトークンを発行（無効なトークンの場合はNone）
+        
+        token_hash のユニークインデックスで検索し、行をロックしてから削除するため、
+        同じリフレッシュトークンで同時にリクエストされても発行されるのは一度だけになる。
+        """
+        token_data = AuthService.decode_token(refresh_token, token_type="refresh")
+        if token_data is None:
+            return None
+        
+        auth_token = await db.scalar(
+            select(AuthToken).where(
+                AuthToken.token_hash == AuthService.hash_refresh_token(refresh_token),
+                AuthToken.expires_at > func.now()
+            ).with_for_update()
+        )
+        if auth_token is None or auth_token.user_id != token_data.user_id:
+            return None
+        
+        user = await db.get(User, auth_token.user_id)
+        if user is None:
+            return None
+        
+        await db.delete(auth_token)
+        return await AuthService.issue_tokens(db, user)
+    
+    @staticmethod
+    async def prune_expired_tokens(db: AsyncSession, batch_size: int, pause_seconds: float = 0.1) -> int:
+        """期限切れのリフレッシュトークンを batch_size 件ずつ削除し、削除した件数を返す
+        
+        バッチごとにコミットしてロックをすぐに解放する。他のワーカーが削除中の行は飛ばす。
+        """
+        total = 0
+        while True:
+            expired_ids = select(AuthToken.id).where(
+                AuthToken.expires_at <= func.now()
+            ).limit(batch_size).with_for_update(skip_locked=True).scalar_subquery()
+            result = await db.execute(
+                delete(AuthToken)
+                .where(AuthToken.id.in_(expired_ids))
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+            total += result.rowcount
+            if result.rowcount < batch_size:
+                return total
+            await asyncio.sleep(pause_seconds)
+    
+    @staticmethod
+    async def authenticate_user(db: AsyncSession, email: str, password: str) -> Optional[User]:
         """ユーザー認証"""
-        user = db.query(User).filter(
-            User.email == email,
-            User.auth_provider == AuthProvider.EMAIL
-        ).first()
+        user = await db.scalar(
+            select(User).where(
+                User.email == email,
+                User.auth_provider == AuthProvider.EMAIL
+            )
+        )
         if not user:
             return None
-        if not AuthService.verify_password(password, user.password_hash):
+        is_valid, new_hash = await AuthService.verify_and_update_password(password, user.password_hash)
+        if not is_valid:
             return None
+        
+        # コスト（ラウンド数）の設定が変わっていれば新しい設定で保存し直す
+        if new_hash:
+            user.password_hash = new_hash
+            await db.commit()
+            principal_cache.invalidate(user.id)
         return user
     
     @staticmethod
-    def create_user(db: Session, username: str, email: str, password: str) -> User:
+    async def create_user(db: AsyncSession, username: str, email: str, password: str) -> User:
         """新規ユーザー作成"""
-        hashed_password = AuthService.get_password_hash(password)
+        hashed_password = await AuthService.get_password_hash(password)
         user = User(
             username=username,
             email=email,
@@ -85,23 +288,42 @@ class AuthService:
             auth_provider=AuthProvider.EMAIL
         )
         db.add(user)
-        db.commit()
-        db.refresh(user)
+        await db.commit()
+        await db.refresh(user)
         return user
     
     @staticmethod
-    def get_user_by_email(db: Session, email: str) -> Optional[User]:
+    async def get_user_by_email(db: AsyncSession, email: str) -> Optional[User]:
         """メールアドレスでユーザーを取得"""
-        return db.query(User).filter(User.email == email).first()
+        return await db.scalar(select(User).where(User.email == email))
     
     @staticmethod
-    def get_user_by_username(db: Session, username: str) -> Optional[User]:
+    async def get_user_by_username(db: AsyncSession, username: str) -> Optional[User]:
         """ユーザー名でユーザーを取得"""
-        return db.query(User).filter(User.username == username).first()
+        return await db.scalar(select(User).where(User.username == username))
     
     @staticmethod
-    def user_exists(db: Session, username: str, email: str) -> bool:
+    async def user_exists(db: AsyncSession, username: str, email: str) -> bool:
         """ユーザーの存在確認"""
-        return db.query(User).filter(
-            or_(User.username == username, User.email == email)
-        ).first() is not None
\ No newline at end of file
+        return await db.scalar(
+            select(User.id).where(
+                or_(User.username == username, User.email == email)
+            ).limit(1)
+        ) is not None
+
+
+async def prune_auth_tokens_periodically() -> None:
+    """期限切れのリフレッシュトークンを定期的に削除する（lifespanでバックグラウンド実行）"""
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                deleted = await AuthService.prune_expired_tokens(
+                    db, batch_size=settings.AUTH_TOKEN_PRUNE_BATCH_SIZE
+                )
+            if deleted:
+                logger.info(f"Pruned {deleted} expired auth token(s)")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Failed to prune expired auth tokens: {e!r}")
+        await asyncio.sleep(settings.AUTH_TOKEN_PRUNE_INTERVAL_SECONDS)
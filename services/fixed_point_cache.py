@@ -0,0 +1,93 @@
+"""定点一覧のレスポンスキャッシュ
+
+ユーザーに依存しない部分（一覧の行と次ページのカーソル）だけをフィルタ条件ごとにキャッシュし、
+is_favorited はリクエストごとに上書きする。
+定点の作成・更新・削除やお気に入りの追加・削除の際は、その定点が含まれうるエントリだけを削除する。
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from core.config import settings
+
+
+class FixedPointListKey(NamedTuple):
+    """キャッシュのキー（正規化したフィルタ条件とページ位置）"""
+    character_id: Optional[str]
+    map_id: Optional[str]
+    user_id: Optional[int]
+    sort: str
+    cursor: Optional[str]
+    skip: int
+    limit: int
+    
+    def matches(self, map_id: str, character_id: str, user_id: int) -> bool:
+        """指定した定点がこの条件の一覧に含まれうるか"""
+        return (
+            (self.map_id is None or self.map_id == map_id)
+            and (self.character_id is None or self.character_id == character_id)
+            and (self.user_id is None or self.user_id == user_id)
+        )
+
+
+class FixedPointListPage(NamedTuple):
+    rows: List[Dict[str, Any]]  # is_favorited を含まない一覧の行
+    next_cursor: Optional[str]
+
+
+class FixedPointListCache:
+    """定点一覧のプロセス内キャッシュ
+    
+    エントリは ttl_seconds 秒で期限切れになり（他のワーカーでの更新の反映はこの時間だけ遅れる）、
+    max_entries を超えると最も使われていないものから削除する。
+    """
+    
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[FixedPointListKey, Tuple[float, FixedPointListPage]]" = OrderedDict()
+        # 無効化のたびに増える。クエリ中に無効化された結果を保存しないために使う
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key: FixedPointListKey) -> Optional[FixedPointListPage]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            cached_at, page = entry
+            if time.monotonic() - cached_at <= self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return page
+            del self._entries[key]
+        self.misses += 1
+        return None
+    
+    def set(self, key: FixedPointListKey, page: FixedPointListPage, generation: int) -> None:
+        """クエリ開始時の generation を渡す（その後に無効化があった場合は保存しない）"""
+        if generation != self.generation or self.max_entries <= 0:
+            return
+        self._entries[key] = (time.monotonic(), page)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    def invalidate(self, map_id: str, character_id: str, user_id: int) -> None:
+        """指定した定点が含まれうるエントリを削除"""
+        self.generation += 1
+        for key in [key for key in self._entries if key.matches(map_id, character_id, user_id)]:
+            del self._entries[key]
+    
+    def clear(self) -> None:
+        self.generation += 1
+        self._entries.clear()
+    
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+# シングルトンインスタンス
+fixed_point_list_cache = FixedPointListCache(
+    ttl_seconds=settings.FIXED_POINT_LIST_CACHE_TTL_SECONDS,
+    max_entries=settings.FIXED_POINT_LIST_CACHE_MAX_ENTRIES
+)
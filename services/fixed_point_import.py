@@ -0,0 +1,174 @@
+"""定点の一括インポート（NDJSON）
+
+1行に1件の FixedPointCreate 形式のJSONを読み込み、行ごとに検証したうえで、
+fixed_points と fixed_point_steps を複数行のINSERT（fixed_points は RETURNING でIDを取得）でまとめて登録する。
+chunk_size 件ごとに1トランザクションでコミットするため、途中で失敗してもそれまでのチャンクは登録済みになる。
+"""
+import json
+import time
+from typing import AsyncIterable, AsyncIterator, List, Optional, Set, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import settings
+from models.fixed_point import FixedPoint, FixedPointStep
+from schemas.fixed_point import FixedPointCreate, FixedPointImportError, FixedPointImportResponse
+from services.fixed_point_cache import fixed_point_list_cache
+
+
+async def iter_ndjson_lines(
+    chunks: AsyncIterable[bytes],
+    max_line_bytes: int = settings.FIXED_POINT_IMPORT_MAX_LINE_BYTES
+) -> AsyncIterator[Tuple[int, Optional[bytes]]]:
+    """バイト列のストリームを (行番号, 行) に分割する（空行は読み飛ばす）
+    
+    max_line_bytes を超える行は行の代わりに None を返し、その行の残りは読み捨てる。
+    """
+    buffer = b""
+    line_no = 0
+    skipping = False  # 長すぎる行の残りを読み捨て中
+    
+    async for chunk in chunks:
+        buffer += chunk
+        while True:
+            newline = buffer.find(b"\n")
+            if newline == -1:
+                break
+            line, buffer = buffer[:newline], buffer[newline + 1:]
+            if skipping:
+                skipping = False
+                continue
+            line_no += 1
+            if len(line) > max_line_bytes:
+                yield line_no, None
+            elif line.strip():
+                yield line_no, line
+        
+        if not skipping and len(buffer) > max_line_bytes:
+            line_no += 1
+            yield line_no, None
+            buffer = b""
+            skipping = True
+        elif skipping:
+            buffer = b""
+    
+    if buffer.strip() and not skipping:
+        line_no += 1
+        yield line_no, buffer
+
+
+def parse_fixed_point_line(line: bytes) -> FixedPointCreate:
+    """1行を FixedPointCreate として検証する（エラーは ValueError でメッセージを返す）"""
+    try:
+        data = json.loads(line)
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError(f"Invalid JSON: {e}")
+    
+    try:
+        return FixedPointCreate.model_validate(data)
+    except ValidationError as e:
+        raise ValueError("; ".join(
+            f"{'.'.join(str(loc) for loc in error['loc']) or 'record'}: {error['msg']}"
+            for error in e.errors()
+        ))
+
+
+async def insert_fixed_points(db: AsyncSession, user_id: int, records: List[FixedPointCreate]) -> None:
+    """定点とステップを複数行のINSERTで登録する（コミットは呼び出し側で行う）"""
+    fixed_point_ids = (await db.scalars(
+        insert(FixedPoint).returning(FixedPoint.id, sort_by_parameter_order=True),
+        [
+            {
+                "user_id": user_id,
+                "title": record.title,
+                "character_id": record.character_id,
+                "map_id": record.map_id,
+            }
+            for record in records
+        ]
+    )).all()
+    
+    await db.execute(
+        insert(FixedPointStep),
+        [
+            {
+                "fixed_point_id": fixed_point_id,
+                **step.model_dump(),
+            }
+            for fixed_point_id, record in zip(fixed_point_ids, records)
+            for step in record.steps
+        ]
+    )
+
+
+async def import_fixed_points(
+    db: AsyncSession,
+    user_id: int,
+    chunks: AsyncIterable[bytes],
+    chunk_size: int = settings.FIXED_POINT_IMPORT_CHUNK_SIZE,
+    max_errors: int = settings.FIXED_POINT_IMPORT_MAX_ERRORS
+) -> FixedPointImportResponse:
+    """NDJSONのストリームから定点を一括登録する
+    
+    検証に失敗した行と、登録に失敗したチャンクの行はエラーとして報告し、残りの登録は続ける。
+    """
+    started_at = time.perf_counter()
+    imported = 0
+    failed = 0
+    errors: List[FixedPointImportError] = []
+    pending: List[Tuple[int, FixedPointCreate]] = []
+    # 一覧のキャッシュを削除する (map_id, character_id)
+    touched: Set[Tuple[str, str]] = set()
+    
+    def report(line_no: int, message: str) -> None:
+        nonlocal failed
+        failed += 1
+        if len(errors) < max_errors:
+            errors.append(FixedPointImportError(line=line_no, error=message))
+    
+    async def flush() -> None:
+        nonlocal imported
+        if not pending:
+            return
+        try:
+            await insert_fixed_points(db, user_id, [record for _, record in pending])
+            await db.commit()
+        except SQLAlchemyError as e:
+            await db.rollback()
+            message = f"Database error: {e.__class__.__name__}"
+            for line_no, _ in pending:
+                report(line_no, message)
+        else:
+            imported += len(pending)
+            touched.update((record.map_id, record.character_id) for _, record in pending)
+        pending.clear()
+    
+    try:
+        async for line_no, line in iter_ndjson_lines(chunks):
+            if line is None:
+                report(line_no, f"Line exceeds {settings.FIXED_POINT_IMPORT_MAX_LINE_BYTES} bytes")
+                continue
+            try:
+                pending.append((line_no, parse_fixed_point_line(line)))
+            except ValueError as e:
+                report(line_no, str(e))
+                continue
+            if len(pending) >= chunk_size:
+                await flush()
+        await flush()
+    finally:
+        # 途中で中断された場合もコミット済みのチャンクは一覧に反映する
+        for map_id, character_id in touched:
+            fixed_point_list_cache.invalidate(map_id=map_id, character_id=character_id, user_id=user_id)
+    
+    elapsed = time.perf_counter() - started_at
+    return FixedPointImportResponse(
+        imported=imported,
+        failed=failed,
+        errors=errors,
+        elapsed_seconds=round(elapsed, 3),
+        records_per_second=round(imported / elapsed, 1) if elapsed > 0 else 0.0
+    )
@@ -0,0 +1,133 @@
+"""外部API用の共有HTTPクライアント
+
+上流（Discord・Valorant API等）ごとに1つの httpx.AsyncClient をアプリケーションの起動から終了まで使い回し、
+リクエストのたびに発生するDNS解決・TCP/TLS接続のコストを避ける。
+上流ごとのレイテンシとエラー率を記録する。
+"""
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+import logging
+
+import httpx
+
+from core.config import settings
+from core.metrics import latency_summary
+
+logger = logging.getLogger(__name__)
+
+# レイテンシの統計に使う直近のリクエスト数
+LATENCY_SAMPLE_SIZE = 1000
+
+
+class UpstreamMetrics:
+    """上流ごとのリクエスト数・エラー数・レイテンシ"""
+    
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0  # 接続エラー・タイムアウト・5xx
+        self.status_counts: Dict[str, int] = {}
+        self._latencies: Deque[float] = deque(maxlen=LATENCY_SAMPLE_SIZE)
+    
+    def record(self, seconds: float, status_code: Optional[int] = None, error: Optional[str] = None) -> None:
+        self.requests += 1
+        self._latencies.append(seconds)
+        key = error or f"{status_code // 100}xx"
+        self.status_counts[key] = self.status_counts.get(key, 0) + 1
+        if error or status_code >= 500:
+            self.errors += 1
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "error_rate": round(self.errors / self.requests, 4) if self.requests else 0.0,
+            "status": dict(self.status_counts),
+            "latency": latency_summary(self._latencies),
+        }
+
+
+class MetricsTransport(httpx.AsyncBaseTransport):
+    """リクエストごとにレイテンシと結果を記録するトランスポート（レスポンスヘッダーの受信までを計測）"""
+    
+    def __init__(self, transport: httpx.AsyncBaseTransport, metrics: UpstreamMetrics):
+        self._transport = transport
+        self._metrics = metrics
+    
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        started_at = time.perf_counter()
+        try:
+            response = await self._transport.handle_async_request(request)
+        except httpx.TransportError as e:
+            self._metrics.record(time.perf_counter() - started_at, error=type(e).__name__)
+            raise
+        self._metrics.record(time.perf_counter() - started_at, status_code=response.status_code)
+        return response
+    
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+class HTTPClientRegistry:
+    """上流ごとの共有 httpx.AsyncClient を管理する
+    
+    上流は利用する側のモジュールで register しておき、
+    クライアントは start（lifespan）で作成して close で閉じる。
+    start の前に get された場合（スクリプト等）はその場で作成する。
+    """
+    
+    def __init__(self):
+        self._options: Dict[str, Dict[str, Any]] = {}
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._metrics: Dict[str, UpstreamMetrics] = {}
+    
+    def register(self, name: str, **client_options: Any) -> None:
+        """上流を登録（client_options は httpx.AsyncClient の引数）"""
+        self._options[name] = client_options
+        self._metrics.setdefault(name, UpstreamMetrics())
+    
+    def _create_client(self, name: str) -> httpx.AsyncClient:
+        limits = httpx.Limits(
+            max_connections=settings.HTTP_CLIENT_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.HTTP_CLIENT_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.HTTP_CLIENT_KEEPALIVE_EXPIRY_SECONDS
+        )
+        timeout = httpx.Timeout(
+            settings.HTTP_CLIENT_TIMEOUT_SECONDS,
+            connect=settings.HTTP_CLIENT_CONNECT_TIMEOUT_SECONDS
+        )
+        options = {"timeout": timeout, **self._options[name]}
+        transport = MetricsTransport(httpx.AsyncHTTPTransport(limits=limits), self._metrics[name])
+        return httpx.AsyncClient(transport=transport, **options)
+    
+    def get(self, name: str) -> httpx.AsyncClient:
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            if name not in self._options:
+                raise KeyError(f"Unknown upstream: {name}")
+            client = self._create_client(name)
+            self._clients[name] = client
+        return client
+    
+    async def start(self) -> None:
+        """登録済みの全上流のクライアントを作成（アプリケーション起動時）"""
+        for name in self._options:
+            self.get(name)
+    
+    async def close(self) -> None:
+        """全クライアントの接続を閉じる（アプリケーション終了時）"""
+        clients = list(self._clients.values())
+        self._clients.clear()
+        for client in clients:
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.warning(f"Failed to close HTTP client: {e!r}")
+    
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """上流ごとのレイテンシとエラー率"""
+        return {name: metrics.stats() for name, metrics in self._metrics.items()}
+
+
+# シングルトンインスタンス
+http_clients = HTTPClientRegistry()
@@ -1,107 +1,269 @@
 """画像キャッシュサービス"""
+import asyncio
+import json
 import os
+import time
 import aiohttp
 import aiofiles
 from pathlib import Path
-from typing import Optional
+from typing import Any, Dict, List, Optional, Tuple
 import logging
 
 logger = logging.getLogger(__name__)
 
+# 同時にダウンロードする画像の最大数
+MAX_CONCURRENT_DOWNLOADS = 8
+DOWNLOAD_TIMEOUT_SECONDS = 30
+# マニフェストの書き込みをまとめるための待ち時間（秒）
+MANIFEST_SAVE_DELAY_SECONDS = 1.0
+
+
 class ImageCacheService:
     """Valorant画像のローカルキャッシュを管理"""
     
-    def __init__(self):
+    def __init__(self, max_concurrent_downloads: int = MAX_CONCURRENT_DOWNLOADS):
         self.static_dir = Path("static")
-        self.agents_dir = self.static_dir / "images" / "agents"
-        self.maps_dir = self.static_dir / "images" / "maps"
+        self.images_dir = self.static_dir / "images"
+        self.agents_dir = self.images_dir / "agents"
+        self.maps_dir = self.images_dir / "maps"
+        self.manifest_path = self.images_dir / "manifest.json"
         
         # ディレクトリが存在することを確認
         self.agents_dir.mkdir(parents=True, exist_ok=True)
         self.maps_dir.mkdir(parents=True, exist_ok=True)
+        
+        # これより前に保存された画像は古いものとして再ダウンロードする
+        self.invalidated_at = 0.0
+        # キャッシュ済み画像のマニフェスト（images_dirからの相対パス -> 保存時刻）
+        # リクエストごとにファイルシステムを確認せず、辞書の参照だけで判定する
+        self._manifest: Dict[str, float] = {}
+        self._save_task: Optional[asyncio.Task] = None
+        self._load_manifest()
+        
+        # 全ダウンロードで共有するHTTPセッション（初回利用時に作成）
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore = asyncio.Semaphore(max_concurrent_downloads)
+        self.max_concurrent_downloads = max_concurrent_downloads
+        # 保存先 -> 実行中のダウンロード（同じ画像の同時ダウンロードを1回にまとめる）
+        self._inflight: Dict[Path, asyncio.Task] = {}
+    
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_concurrent_downloads),
+                timeout=aiohttp.ClientTimeout(total=DOWNLOAD_TIMEOUT_SECONDS)
+            )
+        return self._session
+    
+    async def close(self) -> None:
+        """共有HTTPセッションを閉じ、未保存のマニフェストを書き出す（アプリケーション終了時）"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        
+        if self._save_task is not None:
+            self._save_task.cancel()
+            self._save_task = None
+            await asyncio.to_thread(self._write_manifest)
+    
+    def _manifest_key(self, filepath: Path) -> str:
+        return filepath.relative_to(self.images_dir).as_posix()
+    
+    def _load_manifest(self) -> None:
+        """起動時に一度だけ、インデックスファイルとディレクトリの内容からマニフェストを構築"""
+        saved: Dict[str, float] = {}
+        try:
+            with open(self.manifest_path) as f:
+                data = json.load(f)
+            self.invalidated_at = float(data.get("invalidated_at", 0.0))
+            saved = {key: float(value) for key, value in data.get("files", {}).items()}
+        except FileNotFoundError:
+            pass
+        except (ValueError, TypeError, AttributeError) as e:
+            logger.warning(f"Ignoring corrupt image manifest {self.manifest_path}: {e}")
+        
+        # インデックスにない・削除されたファイルがあっても実際の内容に合わせる
+        for directory in (self.agents_dir, self.maps_dir):
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_file() and entry.name.endswith(".png"):
+                        key = self._manifest_key(directory / entry.name)
+                        self._manifest[key] = saved.get(key, entry.stat().st_mtime)
+        
+        logger.info(f"Loaded image manifest with {len(self._manifest)} entries")
+    
+    def _write_manifest(self) -> None:
+        data = {"invalidated_at": self.invalidated_at, "files": dict(self._manifest)}
+        tmp_path = self.manifest_path.with_suffix(".json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.manifest_path)
+    
+    def _schedule_save(self) -> None:
+        """マニフェストの書き出しを予約（連続した更新は1回の書き込みにまとめる）"""
+        if self._save_task is None:
+            self._save_task = asyncio.create_task(self._save_manifest())
+    
+    async def _save_manifest(self) -> None:
+        await asyncio.sleep(MANIFEST_SAVE_DELAY_SECONDS)
+        self._save_task = None
+        try:
+            await asyncio.to_thread(self._write_manifest)
+        except Exception as e:
+            logger.error(f"Failed to save image manifest: {e}")
+    
+    def invalidate(self) -> None:
+        """キャッシュ済みの画像を古いものとして扱う（ゲームのバージョン更新時）"""
+        self.invalidated_at = time.time()
+        self._schedule_save()
+    
+    def is_cached(self, filepath: Path) -> bool:
+        """有効なキャッシュが存在するか"""
+        cached_at = self._manifest.get(self._manifest_key(filepath))
+        return cached_at is not None and cached_at >= self.invalidated_at
+    
+    def agent_image_path(self, agent_uuid: str) -> Path:
+        """エージェント画像の保存先"""
+        return self.agents_dir / f"{agent_uuid}.png"
+    
+    def map_image_paths(self, map_uuid: str) -> Tuple[Path, Path]:
+        """マップ画像（アイコン、スプラッシュ）の保存先"""
+        return self.maps_dir / f"{map_uuid}_icon.png", self.maps_dir / f"{map_uuid}_splash.png"
+    
+    @staticmethod
+    def to_url(filepath: Path) -> str:
+        """保存先から配信用のパスに変換"""
+        return f"/{filepath.as_posix()}"
     
     async def download_image(self, url: str, filepath: Path) -> bool:
         """画像をダウンロードして保存"""
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url) as response:
+            async with self._semaphore:
+                async with self._get_session().get(url) as response:
                     if response.status == 200:
                         content = await response.read()
-                        async with aiofiles.open(filepath, 'wb') as f:
-                            await f.write(content)
-                        logger.info(f"Downloaded image: {filepath}")
-                        return True
                     else:
                         logger.error(f"Failed to download image from {url}: {response.status}")
                         return False
+            
+            # 配信中のファイルを壊さないよう一時ファイルに書いてから置き換える
+            tmp_filepath = filepath.with_suffix(filepath.suffix + ".tmp")
+            async with aiofiles.open(tmp_filepath, 'wb') as f:
+                await f.write(content)
+            os.replace(tmp_filepath, filepath)
+            self._manifest[self._manifest_key(filepath)] = time.time()
+            self._schedule_save()
+            logger.info(f"Downloaded image: {filepath}")
+            return True
         except Exception as e:
             logger.error(f"Error downloading image from {url}: {e}")
             return False
     
-    async def cache_agent_image(self, agent_uuid: str, image_url: str) -> Optional[str]:
-        """エージェント画像をキャッシュ"""
-        filename = f"{agent_uuid}.png"
-        filepath = self.agents_dir / filename
-        
+    async def cache_image(self, filepath: Path, image_url: str) -> Optional[str]:
+        """画像をキャッシュして配信用のパスを返す"""
         # 既にキャッシュされている場合はそのパスを返す
-        if filepath.exists():
-            return f"/static/images/agents/{filename}"
+        if self.is_cached(filepath):
+            return self.to_url(filepath)
+        
+        # 同じ画像のダウンロードが実行中であればその結果を待つ
+        task = self._inflight.get(filepath)
+        if task is None:
+            task = asyncio.create_task(self.download_image(image_url, filepath))
+            self._inflight[filepath] = task
+            task.add_done_callback(lambda _: self._inflight.pop(filepath, None))
         
-        # ダウンロードしてキャッシュ
-        success = await self.download_image(image_url, filepath)
+        success = await asyncio.shield(task)
         if success:
-            return f"/static/images/agents/{filename}"
+            return self.to_url(filepath)
         return None
     
-    async def cache_map_images(self, map_uuid: str, display_icon_url: str, splash_url: str) -> dict:
-        """マップ画像をキャッシュ（アイコンとスプラッシュ）"""
-        result = {}
+    async def cache_many(self, images: List[Tuple[Path, str]]) -> List[Optional[str]]:
+        """複数の画像を並行してキャッシュ
         
-        # Display icon
-        icon_filename = f"{map_uuid}_icon.png"
-        icon_filepath = self.maps_dir / icon_filename
-        if icon_filepath.exists():
-            result['displayIcon'] = f"/static/images/maps/{icon_filename}"
-        else:
-            success = await self.download_image(display_icon_url, icon_filepath)
-            if success:
-                result['displayIcon'] = f"/static/images/maps/{icon_filename}"
+        Args:
+            images: (保存先, 画像URL) のリスト
         
-        # Splash image
-        splash_filename = f"{map_uuid}_splash.png"
-        splash_filepath = self.maps_dir / splash_filename
-        if splash_filepath.exists():
-            result['splash'] = f"/static/images/maps/{splash_filename}"
-        else:
-            success = await self.download_image(splash_url, splash_filepath)
-            if success:
-                result['splash'] = f"/static/images/maps/{splash_filename}"
+        Returns:
+            配信用のパスのリスト（入力と同じ順序、失敗した画像はNone）
+        """
+        return await asyncio.gather(*[
+            self.cache_image(filepath, image_url) for filepath, image_url in images
+        ])
+    
+    async def localize_agents(self, agents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """エージェント画像を並行してキャッシュし、URLをローカルパスに置き換えたコピーを返す"""
+        # 呼び出し元（カタログのキャッシュ）のデータを書き換えないようにコピーする
+        agents = [dict(agent) for agent in agents]
+        targets = [agent for agent in agents if agent.get('displayIcon')]
+        cached_paths = await self.cache_many([
+            (self.agent_image_path(agent['uuid']), agent['displayIcon'])
+            for agent in targets
+        ])
+        for agent, cached_path in zip(targets, cached_paths):
+            if cached_path:
+                agent['displayIcon'] = cached_path
+        return agents
+    
+    async def localize_maps(self, maps: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """マップ画像（アイコンとスプラッシュ）を並行してキャッシュし、URLをローカルパスに置き換えたコピーを返す"""
+        # 呼び出し元（カタログのキャッシュ）のデータを書き換えないようにコピーする
+        maps = [dict(map_data) for map_data in maps]
+        targets = [
+            map_data for map_data in maps
+            if map_data.get('displayIcon') and map_data.get('splash')
+        ]
+        images = []
+        for map_data in targets:
+            icon_filepath, splash_filepath = self.map_image_paths(map_data['uuid'])
+            images.append((icon_filepath, map_data['displayIcon']))
+            images.append((splash_filepath, map_data['splash']))
+        cached_paths = await self.cache_many(images)
+        for i, map_data in enumerate(targets):
+            icon_path, splash_path = cached_paths[2 * i], cached_paths[2 * i + 1]
+            if icon_path:
+                map_data['displayIcon'] = icon_path
+            if splash_path:
+                map_data['splash'] = splash_path
+        return maps
+    
+    async def cache_agent_image(self, agent_uuid: str, image_url: str) -> Optional[str]:
+        """エージェント画像をキャッシュ"""
+        return await self.cache_image(self.agent_image_path(agent_uuid), image_url)
+    
+    async def cache_map_images(self, map_uuid: str, display_icon_url: str, splash_url: str) -> dict:
+        """マップ画像をキャッシュ（アイコンとスプラッシュ）"""
+        icon_filepath, splash_filepath = self.map_image_paths(map_uuid)
+        icon_path, splash_path = await self.cache_many([
+            (icon_filepath, display_icon_url),
+            (splash_filepath, splash_url),
+        ])
         
+        result = {}
+        if icon_path:
+            result['displayIcon'] = icon_path
+        if splash_path:
+            result['splash'] = splash_path
         return result
     
     def get_cached_agent_image(self, agent_uuid: str) -> Optional[str]:
         """キャッシュされたエージェント画像のパスを取得"""
-        filename = f"{agent_uuid}.png"
-        filepath = self.agents_dir / filename
-        if filepath.exists():
-            return f"/static/images/agents/{filename}"
+        filepath = self.agent_image_path(agent_uuid)
+        if self.is_cached(filepath):
+            return self.to_url(filepath)
         return None
     
     def get_cached_map_images(self, map_uuid: str) -> dict:
         """キャッシュされたマップ画像のパスを取得"""
         result = {}
+        icon_filepath, splash_filepath = self.map_image_paths(map_uuid)
         
-        icon_filename = f"{map_uuid}_icon.png"
-        icon_filepath = self.maps_dir / icon_filename
-        if icon_filepath.exists():
-            result['displayIcon'] = f"/static/images/maps/{icon_filename}"
+        if self.is_cached(icon_filepath):
+            result['displayIcon'] = self.to_url(icon_filepath)
         
-        splash_filename = f"{map_uuid}_splash.png"
-        splash_filepath = self.maps_dir / splash_filename
-        if splash_filepath.exists():
-            result['splash'] = f"/static/images/maps/{splash_filename}"
+        if self.is_cached(splash_filepath):
+            result['splash'] = self.to_url(splash_filepath)
         
         return result
 
 # シングルトンインスタンス
-image_cache_service = ImageCacheService()
\ No newline at end of file
+image_cache_service = ImageCacheService()
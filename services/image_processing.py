@@ -0,0 +1,176 @@
+"""画像処理サービス（Pillowによる処理をワーカープールで実行）"""
+import asyncio
+import os
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+import logging
+
+from PIL import Image, ImageOps
+
+from core.config import settings
+from core.metrics import latency_summary
+
+logger = logging.getLogger(__name__)
+
+# 派生画像のサイズ（長辺の最大ピクセル数、Noneは元のサイズのまま）
+VARIANT_SIZES = {
+    "thumb": 320,
+    "medium": 1280,
+    "full": None,
+}
+WEBP_QUALITY = 80
+# レイテンシの統計に使う直近のジョブ数
+LATENCY_SAMPLE_SIZE = 1000
+
+
+def verify_image(path: str) -> Dict[str, Any]:
+    """画像として開けるか検証し、メタデータを返す（ワーカープール内で実行）"""
+    with Image.open(path) as img:
+        metadata = {"format": img.format, "width": img.width, "height": img.height}
+        img.verify()
+    return metadata
+
+
+def create_webp_variant(source_path: str, destination_path: str, max_size: Optional[int]) -> None:
+    """リサイズしたWebPの派生画像を生成（ワーカープール内で実行）"""
+    with Image.open(source_path) as img:
+        # EXIFの回転情報を反映し、アニメーション画像は先頭フレームを使う
+        variant = ImageOps.exif_transpose(img)
+        if variant.mode not in ("RGB", "RGBA"):
+            variant = variant.convert("RGBA" if variant.mode in ("P", "LA", "PA") else "RGB")
+        if max_size:
+            variant.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+        
+        # 配信中のファイルを壊さないよう一時ファイルに書いてから置き換える
+        tmp_path = f"{destination_path}.tmp"
+        variant.save(tmp_path, format="WEBP", quality=WEBP_QUALITY, method=4)
+    os.replace(tmp_path, destination_path)
+
+
+def _timed_call(func: Callable[..., Any], args: Tuple[Any, ...]) -> Tuple[Any, float]:
+    """ワーカー内での実行時間を計測して結果と一緒に返す"""
+    started_at = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started_at
+
+
+class ImageProcessingError(Exception):
+    """画像処理のワーカープール側の問題（画像の内容によらないエラー）"""
+    pass
+
+
+class ImageProcessingBusyError(ImageProcessingError):
+    """処理待ちのジョブ数が上限に達している"""
+    pass
+
+
+class ImageProcessingWorkerError(ImageProcessingError):
+    """ワーカープロセスが異常終了した"""
+    pass
+
+
+class ImageProcessingService:
+    """CPU負荷の高い画像処理をイベントループの外で実行する
+    
+    実行中と待機中のジョブの合計が max_workers + max_queue_size を超える場合は
+    ImageProcessingBusyError を送出して受け付けない。
+    ワーカープロセスが異常終了した場合はプールを破棄して ImageProcessingWorkerError を送出し、
+    次のジョブで新しいプールを作成する。
+    """
+    
+    def __init__(self, max_workers: int, executor_type: str = "process", max_queue_size: int = 32):
+        if executor_type not in ("process", "thread"):
+            raise ValueError(f"Unknown executor type: {executor_type}")
+        self.max_workers = max_workers
+        self.executor_type = executor_type
+        self.max_queue_size = max_queue_size
+        self._executor: Optional[Executor] = None
+        
+        # メトリクス
+        self._in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._wait_times: Deque[float] = deque(maxlen=LATENCY_SAMPLE_SIZE)
+        self._run_times: Deque[float] = deque(maxlen=LATENCY_SAMPLE_SIZE)
+    
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.executor_type == "thread":
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="image-processing"
+                )
+            else:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+    
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        """関数をワーカープールで実行（プロセスプールの場合、関数と引数はpickle可能である必要がある）"""
+        if self._in_flight >= self.max_workers + self.max_queue_size:
+            self.rejected += 1
+            raise ImageProcessingBusyError("Image processing queue is full")
+        
+        loop = asyncio.get_running_loop()
+        submitted_at = time.perf_counter()
+        self._in_flight += 1
+        executor = self._get_executor()
+        try:
+            result, run_seconds = await loop.run_in_executor(
+                executor, _timed_call, func, args
+            )
+        except BrokenProcessPool as e:
+            self.failed += 1
+            # 壊れたプールは以降のジョブも全て失敗するため、作り直させる
+            if self._executor is executor:
+                logger.error(f"Image processing worker died during {func.__name__}, recreating the pool")
+                self._executor = None
+                executor.shutdown(wait=False, cancel_futures=True)
+            raise ImageProcessingWorkerError("Image processing worker terminated abruptly") from e
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self._in_flight -= 1
+        
+        total_seconds = time.perf_counter() - submitted_at
+        self.completed += 1
+        self._run_times.append(run_seconds)
+        self._wait_times.append(max(0.0, total_seconds - run_seconds))
+        logger.debug(
+            f"{func.__name__} finished in {total_seconds * 1000:.1f}ms "
+            f"(run {run_seconds * 1000:.1f}ms)"
+        )
+        return result
+    
+    def stats(self) -> Dict[str, Any]:
+        """キュー長とジョブごとのレイテンシ（プールのサイズ調整用）"""
+        return {
+            "executor": self.executor_type,
+            "workers": self.max_workers,
+            "max_queue_size": self.max_queue_size,
+            "in_flight": self._in_flight,
+            "queue_depth": max(0, self._in_flight - self.max_workers),
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "wait": latency_summary(self._wait_times),
+            "run": latency_summary(self._run_times),
+        }
+    
+    def shutdown(self) -> None:
+        """ワーカープールを終了（アプリケーション終了時）"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# シングルトンインスタンス
+image_processing_service = ImageProcessingService(
+    max_workers=settings.IMAGE_PROCESS_WORKERS,
+    executor_type=settings.IMAGE_PROCESSING_EXECUTOR,
+    max_queue_size=settings.IMAGE_PROCESSING_MAX_QUEUE
+)
@@ -0,0 +1,214 @@
+"""OAuthのstate保存サービス
+
+ログイン開始時に発行したstateをコールバックまで保持する。
+放置されたログインでエントリが溜まらないよう、TTLで期限切れにし、件数の上限を超えた場合は古いものから削除する。
+
+バックエンド（settings.OAUTH_STATE_BACKEND）:
+    memory: プロセス内の辞書（ワーカーが1つの場合のみ）
+    sqlite: 同じホストの複数ワーカーでSQLiteファイルを共有する
+    redis:  Redis互換サーバーを共有する（redis パッケージが必要）
+"""
+import asyncio
+import json
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from core.config import settings
+
+
+class OAuthStateStore(ABC):
+    """stateの保存先のインターフェース"""
+    
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+    
+    @abstractmethod
+    async def put(self, state: str, data: Dict[str, Any]) -> None:
+        """stateを保存"""
+    
+    @abstractmethod
+    async def pop(self, state: str) -> Optional[Dict[str, Any]]:
+        """stateを取り出して削除（存在しないか期限切れの場合はNone、同じstateは一度しか使えない）"""
+    
+    async def close(self) -> None:
+        pass
+
+
+class MemoryOAuthStateStore(OAuthStateStore):
+    """プロセス内の辞書に保存する（ワーカー間では共有されない）"""
+    
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        super().__init__(ttl_seconds, max_entries)
+        # state -> (期限, データ)。挿入順に並ぶため先頭ほど古い
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+    
+    def _evict(self, now: float) -> None:
+        while self._entries:
+            state, (expires_at, _) = next(iter(self._entries.items()))
+            if expires_at > now and len(self._entries) <= self.max_entries:
+                break
+            del self._entries[state]
+    
+    async def put(self, state: str, data: Dict[str, Any]) -> None:
+        now = time.monotonic()
+        self._entries[state] = (now + self.ttl_seconds, data)
+        self._entries.move_to_end(state)
+        self._evict(now)
+    
+    async def pop(self, state: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.pop(state, None)
+        if entry is None:
+            return None
+        expires_at, data = entry
+        if expires_at <= time.monotonic():
+            return None
+        return data
+
+
+class SQLiteOAuthStateStore(OAuthStateStore):
+    """SQLiteファイルに保存する（同じホストの複数ワーカープロセスで共有できる）
+    
+    sqlite3 はブロッキングなので、操作はスレッドで実行する。
+    """
+    
+    def __init__(self, path: str, ttl_seconds: float, max_entries: int):
+        super().__init__(ttl_seconds, max_entries)
+        self.path = path
+        self._initialized = False
+    
+    def _connect(self) -> sqlite3.Connection:
+        # isolation_level=None でトランザクションを明示的に制御する
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        if not self._initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS oauth_states ("
+                "state TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_oauth_states_expires_at ON oauth_states (expires_at)"
+            )
+            self._initialized = True
+        return conn
+    
+    def _put(self, state: str, data: Dict[str, Any]) -> None:
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT OR REPLACE INTO oauth_states (state, data, expires_at) VALUES (?, ?, ?)",
+                (state, json.dumps(data), now + self.ttl_seconds)
+            )
+            conn.execute("DELETE FROM oauth_states WHERE expires_at <= ?", (now,))
+            # 上限を超えた分は期限の近い（古い）ものから削除
+            conn.execute(
+                "DELETE FROM oauth_states WHERE state IN ("
+                "SELECT state FROM oauth_states ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+    
+    def _pop(self, state: str) -> Optional[Dict[str, Any]]:
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT data, expires_at FROM oauth_states WHERE state = ?", (state,)
+            ).fetchone()
+            if row is not None:
+                conn.execute("DELETE FROM oauth_states WHERE state = ?", (state,))
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        
+        if row is None or row[1] <= time.time():
+            return None
+        return json.loads(row[0])
+    
+    async def put(self, state: str, data: Dict[str, Any]) -> None:
+        await asyncio.to_thread(self._put, state, data)
+    
+    async def pop(self, state: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self._pop, state)
+
+
+class RedisOAuthStateStore(OAuthStateStore):
+    """Redis互換サーバーに保存する（redis パッケージが必要）
+    
+    各stateはTTL付きのキーで保存し、件数の上限は発行時刻のソート済みセットで管理する。
+    """
+    
+    KEY_PREFIX = "oauth_state:"
+    INDEX_KEY = "oauth_state_index"
+    
+    def __init__(self, url: str, ttl_seconds: float, max_entries: int):
+        super().__init__(ttl_seconds, max_entries)
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError(
+                "OAUTH_STATE_BACKEND=redis requires the redis package "
+                "(install with: uv sync --extra redis)"
+            )
+        self._client = redis.from_url(url, decode_responses=True)
+    
+    async def put(self, state: str, data: Dict[str, Any]) -> None:
+        now = time.time()
+        async with self._client.pipeline(transaction=True) as pipe:
+            pipe.set(f"{self.KEY_PREFIX}{state}", json.dumps(data), ex=int(self.ttl_seconds))
+            pipe.zadd(self.INDEX_KEY, {state: now})
+            pipe.zremrangebyscore(self.INDEX_KEY, "-inf", now - self.ttl_seconds)
+            pipe.zcard(self.INDEX_KEY)
+            *_, count = await pipe.execute()
+        
+        # 上限を超えた分は古いものから削除
+        if count > self.max_entries:
+            oldest = await self._client.zpopmin(self.INDEX_KEY, count - self.max_entries)
+            if oldest:
+                await self._client.delete(*[f"{self.KEY_PREFIX}{oldest_state}" for oldest_state, _ in oldest])
+    
+    async def pop(self, state: str) -> Optional[Dict[str, Any]]:
+        async with self._client.pipeline(transaction=True) as pipe:
+            pipe.getdel(f"{self.KEY_PREFIX}{state}")
+            pipe.zrem(self.INDEX_KEY, state)
+            value, _ = await pipe.execute()
+        if value is None:
+            return None
+        return json.loads(value)
+    
+    async def close(self) -> None:
+        await self._client.aclose()
+
+
+def create_oauth_state_store() -> OAuthStateStore:
+    """設定に応じたstateの保存先を作成"""
+    backend = settings.OAUTH_STATE_BACKEND
+    ttl_seconds = settings.OAUTH_STATE_TTL_SECONDS
+    max_entries = settings.OAUTH_STATE_MAX_ENTRIES
+    
+    if backend == "memory":
+        return MemoryOAuthStateStore(ttl_seconds, max_entries)
+    if backend == "sqlite":
+        return SQLiteOAuthStateStore(settings.OAUTH_STATE_SQLITE_PATH, ttl_seconds, max_entries)
+    if backend == "redis":
+        return RedisOAuthStateStore(settings.REDIS_URL, ttl_seconds, max_entries)
+    raise ValueError(f"Unknown OAuth state backend: {backend}")
+
+
+# シングルトンインスタンス
+oauth_state_store = create_oauth_state_store()
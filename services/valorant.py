@@ -1,38 +1,51 @@
 """Valorant API サービス"""
-import httpx
-from typing import List, Optional, Dict, Any
-from functools import lru_cache
+import asyncio
+import time
+from typing import List, Literal, Optional, Dict, Any, Tuple
 import logging
 
+from core.config import settings
+from services.http_clients import http_clients
+from services.image_cache import image_cache_service
+
 logger = logging.getLogger(__name__)
 
 VALORANT_API_BASE_URL = "https://valorant-api.com/v1"
 
+# valorant-api.com が対応している言語（言語はキャッシュのキーになるため、これ以外は受け付けない）
+ValorantLanguage = Literal[
+    "ar-AE", "de-DE", "en-US", "es-ES", "es-MX", "fr-FR", "id-ID", "it-IT", "ja-JP",
+    "ko-KR", "pl-PL", "pt-BR", "ru-RU", "th-TH", "tr-TR", "vi-VN", "zh-CN", "zh-TW",
+]
+
+http_clients.register(
+    "valorant",
+    base_url=VALORANT_API_BASE_URL,
+    headers={
+        "User-Agent": "Fixed-Points-Backend/1.0"
+    }
+)
+
 
 class ValorantAPIService:
     """Valorant APIとの通信を管理するサービス"""
     
     def __init__(self):
-        self.client = httpx.AsyncClient(
-            base_url=VALORANT_API_BASE_URL,
-            timeout=10.0,
-            headers={
-                "User-Agent": "Fixed-Points-Backend/1.0"
-            }
-        )
+        # 接続はアプリケーション全体で共有するため、ここでは閉じない
+        self.client = http_clients.get("valorant")
     
     async def __aenter__(self):
         return self
     
     async def __aexit__(self, *args):
-        await self.client.aclose()
+        pass
     
     async def get_agents(self, language: str = "ja-JP") -> List[Dict[str, Any]]:
         """エージェント一覧を取得
         
         Args:
             language: 言語コード（デフォルト: ja-JP）
-            
+        
         Returns:
             エージェント情報のリスト
         """
@@ -64,7 +77,7 @@ class ValorantAPIService:
                     for agent in agents
                 ]
             return []
-            
+        
         except Exception as e:
             logger.error(f"Failed to fetch agents: {e}")
             return []
@@ -74,7 +87,7 @@ class ValorantAPIService:
         
         Args:
             language: 言語コード（デフォルト: ja-JP）
-            
+        
         Returns:
             マップ情報のリスト
         """
@@ -102,12 +115,202 @@ class ValorantAPIService:
                     if map_data.get("displayName") and map_data.get("coordinates")
                 ]
             return []
-            
+        
         except Exception as e:
             logger.error(f"Failed to fetch maps: {e}")
             return []
+    
+    async def get_version(self) -> Optional[str]:
+        """現在のゲームバージョンを取得（カタログ更新の検知用）
+        
+        Returns:
+            バージョン文字列（取得できない場合はNone）
+        """
+        try:
+            response = await self.client.get("/version")
+            response.raise_for_status()
+            data = response.json()
+            
+            if data.get("status") == 200:
+                return data.get("data", {}).get("version")
+            return None
+        
+        except Exception as e:
+            logger.error(f"Failed to fetch version: {e}")
+            return None
 
 
 # サービスのインスタンスを返す関数
 def get_valorant_service():
-    return ValorantAPIService()
\ No newline at end of file
+    return ValorantAPIService()
+
+
+class ValorantCatalogCache:
+    """言語ごとのエージェント・マップ一覧をプロセス内にキャッシュする
+    
+    カタログはゲームのパッチでしか変わらないため、上流の /version を定期的に確認し、
+    バージョンが変わった時だけキャッシュ済みの全言語と画像を無効化して再取得する
+    （画像は再取得したカタログから裏でダウンロードし直す）。
+    再取得中は古いデータを返し続け、同じキーに対する同時のキャッシュミスは
+    1回の上流呼び出しにまとめる。/version が取得できない間はTTLで再取得する。
+    """
+    
+    def __init__(self, ttl_seconds: float, version_check_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self.version_check_seconds = version_check_seconds
+        # 現在の上流のゲームバージョン（未確認の場合はNone）
+        self.version: Optional[str] = None
+        self._version_checked_at = float("-inf")
+        self._version_task: Optional[asyncio.Task] = None
+        # バージョン更新時の画像の再取得タスク
+        self._image_warmup_task: Optional[asyncio.Task] = None
+        # (種類, 言語) -> (取得時刻, 取得時のバージョン, データ)
+        self._entries: Dict[Tuple[str, str], Tuple[float, Optional[str], List[Dict[str, Any]]]] = {}
+        # (種類, 言語) -> 実行中の取得タスク
+        self._inflight: Dict[Tuple[str, str], asyncio.Task] = {}
+    
+    async def get_agents(self, language: str = "ja-JP") -> List[Dict[str, Any]]:
+        """エージェント一覧を取得（キャッシュ経由）"""
+        return await self._get("agents", language)
+    
+    async def get_maps(self, language: str = "ja-JP") -> List[Dict[str, Any]]:
+        """マップ一覧を取得（キャッシュ経由）"""
+        return await self._get("maps", language)
+    
+    def get_etag(self, kind: str, language: str) -> Optional[str]:
+        """キャッシュ済みカタログのバージョンをETagとして返す"""
+        entry = self._entries.get((kind, language))
+        if entry is None or entry[1] is None:
+            return None
+        return f'W/"{entry[1]}"'
+    
+    def invalidate(self) -> None:
+        """全てのエントリを破棄"""
+        self._entries.clear()
+    
+    async def _get(self, kind: str, language: str) -> List[Dict[str, Any]]:
+        key = (kind, language)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._schedule_version_check()
+            fetched_at, entry_version, data = entry
+            if (self.version is None or entry_version != self.version) and \
+                    time.monotonic() - fetched_at >= self.ttl_seconds:
+                # バージョンが確認できない間と、現在のバージョンで取得できていないデータ
+                # （再取得に失敗した場合など）はTTLで裏から再取得する
+                self._refresh(key)
+            return data
+        
+        # キャッシュミス: 実行中の取得があればその結果を待つ
+        return await asyncio.shield(self._refresh(key))
+    
+    def _schedule_version_check(self) -> Optional[asyncio.Task]:
+        """確認間隔を過ぎていればバージョン確認を1つだけ開始する"""
+        if self._version_task is None and \
+                time.monotonic() - self._version_checked_at >= self.version_check_seconds:
+            self._version_task = asyncio.create_task(self._check_version())
+            self._version_task.add_done_callback(lambda _: setattr(self, "_version_task", None))
+        return self._version_task
+    
+    async def _check_version(self) -> None:
+        async with get_valorant_service() as service:
+            version = await service.get_version()
+        self._version_checked_at = time.monotonic()
+        if version is None:
+            return
+        
+        previous, self.version = self.version, version
+        if previous is not None and previous != version:
+            logger.info(f"Valorant version changed from {previous} to {version}, refreshing catalog")
+            image_cache_service.invalidate()
+            keys = list(self._entries)
+            refreshes = [self._refresh(key) for key in keys]
+            if self._image_warmup_task is None or self._image_warmup_task.done():
+                self._image_warmup_task = asyncio.create_task(self._warm_up_images(keys, refreshes))
+        elif previous is None:
+            # バージョン不明のまま取得したデータは、どのバージョンのものか分からないため取得し直す
+            for key, (_, entry_version, _) in list(self._entries.items()):
+                if entry_version is None:
+                    self._refresh(key)
+    
+    async def _warm_up_images(self, keys: List[Tuple[str, str]], refreshes: List[asyncio.Task]) -> None:
+        """再取得したカタログの画像を取得し直す（リクエスト時にダウンロードを待たせないため）"""
+        try:
+            catalogs = await asyncio.gather(*refreshes)
+            await localize_catalog_images(
+                [data for (kind, _), data in zip(keys, catalogs) if kind == "agents"],
+                [data for (kind, _), data in zip(keys, catalogs) if kind == "maps"]
+            )
+        except Exception as e:
+            logger.error(f"Failed to warm up Valorant images: {e}")
+    
+    def _refresh(self, key: Tuple[str, str]) -> asyncio.Task:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fetch(key))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return task
+    
+    async def _fetch(self, key: Tuple[str, str]) -> List[Dict[str, Any]]:
+        kind, language = key
+        if self.version is None:
+            # 取得したデータにバージョンを紐付けるため、先にバージョンを確認する
+            version_task = self._schedule_version_check()
+            if version_task is not None:
+                await asyncio.shield(version_task)
+        
+        while True:
+            version = self.version
+            async with get_valorant_service() as service:
+                if kind == "agents":
+                    data = await service.get_agents(language)
+                else:
+                    data = await service.get_maps(language)
+            # 取得中にバージョンが変わった場合は、古いバージョンのデータとして保存せずに取得し直す
+            if not data or self.version == version:
+                break
+        
+        if data:
+            self._entries[key] = (time.monotonic(), version, data)
+            return data
+        
+        # 取得に失敗した場合は古いデータがあればそれを返す
+        logger.warning(f"Keeping stale {kind} catalog for {language}")
+        entry = self._entries.get(key)
+        return entry[2] if entry else []
+
+
+# シングルトンインスタンス
+valorant_catalog_cache = ValorantCatalogCache(
+    ttl_seconds=settings.VALORANT_CATALOG_TTL_SECONDS,
+    version_check_seconds=settings.VALORANT_VERSION_CHECK_SECONDS
+)
+
+
+async def localize_catalog_images(
+    agents_by_language: List[List[Dict[str, Any]]],
+    maps_by_language: List[List[Dict[str, Any]]]
+) -> None:
+    """言語ごとのカタログに含まれる全ての画像をキャッシュする"""
+    # 画像のパスは言語に依存しないため、同じ画像は1回だけダウンロードされる
+    await asyncio.gather(
+        *[image_cache_service.localize_agents(agents) for agents in agents_by_language],
+        *[image_cache_service.localize_maps(maps) for maps in maps_by_language]
+    )
+
+
+async def warm_up_catalog(languages: List[str]) -> None:
+    """指定された言語のカタログと全ての画像を事前に取得する（起動時のウォームアップ用）"""
+    catalogs = await asyncio.gather(*[
+        fetch
+        for language in languages
+        for fetch in (valorant_catalog_cache.get_agents(language), valorant_catalog_cache.get_maps(language))
+    ])
+    agents_by_language, maps_by_language = catalogs[0::2], catalogs[1::2]
+    
+    await localize_catalog_images(agents_by_language, maps_by_language)
+    logger.info(
+        f"Warmed up Valorant catalog for {', '.join(languages)}: "
+        f"{sum(map(len, agents_by_language))} agents, {sum(map(len, maps_by_language))} maps"
+    )
@@ -0,0 +1,30 @@
+"""テスト共通の設定
+
+データベースを使うテストは TEST_DATABASE_URL（PostgreSQL、テスト専用のデータベース）が
+設定されている場合のみ実行し、未設定の場合はスキップする。
+アプリケーションのモジュールを読み込む前に DATABASE_URL を差し替えるため、ここで設定する。
+"""
+import os
+from pathlib import Path
+
+import pytest
+
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+if TEST_DATABASE_URL:
+    os.environ["DATABASE_URL"] = TEST_DATABASE_URL
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+
+@pytest.fixture(scope="session")
+def migrated_database() -> str:
+    """マイグレーションを最新まで適用したテスト用データベースのURL"""
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    
+    from alembic import command
+    from alembic.config import Config
+    
+    command.upgrade(Config(str(PROJECT_ROOT / "alembic.ini")), "head")
+    return TEST_DATABASE_URL
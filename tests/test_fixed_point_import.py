@@ -0,0 +1,77 @@
+"""定点の一括インポート（NDJSONの行分割と行ごとのエラー報告）のテスト"""
+import asyncio
+import json
+
+import pytest
+
+from services.fixed_point_import import import_fixed_points, iter_ndjson_lines, parse_fixed_point_line
+
+RECORD = {
+    "title": "A site smoke",
+    "character_id": "agent-1",
+    "map_id": "map-1",
+    "steps": [{"step_order": 1, "description": "stand here"}],
+}
+
+
+async def stream(*chunks: bytes):
+    for chunk in chunks:
+        yield chunk
+
+
+def split_lines(*chunks: bytes, max_line_bytes: int = 1024) -> list:
+    async def collect():
+        return [line async for line in iter_ndjson_lines(stream(*chunks), max_line_bytes=max_line_bytes)]
+    return asyncio.run(collect())
+
+
+def test_lines_split_across_chunk_boundaries_are_joined():
+    assert split_lines(b'{"a": 1}\n{"b"', b': 2}\n{"c": 3', b'}\n') == [
+        (1, b'{"a": 1}'),
+        (2, b'{"b": 2}'),
+        (3, b'{"c": 3}'),
+    ]
+
+
+def test_last_line_without_trailing_newline_is_returned():
+    assert split_lines(b'{"a": 1}\n{"b": 2}') == [(1, b'{"a": 1}'), (2, b'{"b": 2}')]
+
+
+def test_blank_lines_are_skipped_but_still_counted():
+    assert split_lines(b'\n{"a": 1}\n   \n\n{"b": 2}\n\n') == [(2, b'{"a": 1}'), (5, b'{"b": 2}')]
+
+
+def test_overlong_line_is_reported_and_the_rest_of_it_discarded():
+    assert split_lines(b'{"a": 1}\n' + b"x" * 10, b"x" * 10 + b'\n{"b": 2}\n', max_line_bytes=15) == [
+        (1, b'{"a": 1}'),
+        (2, None),
+        (3, b'{"b": 2}'),
+    ]
+
+
+def test_parse_fixed_point_line_validates_the_record():
+    record = parse_fixed_point_line(json.dumps(RECORD).encode())
+    assert record.title == "A site smoke"
+    assert record.steps[0].step_order == 1
+    
+    with pytest.raises(ValueError, match="Invalid JSON"):
+        parse_fixed_point_line(b"{not json")
+    with pytest.raises(ValueError, match="steps"):
+        parse_fixed_point_line(json.dumps({**RECORD, "steps": []}).encode())
+
+
+def test_invalid_lines_are_reported_with_their_line_numbers():
+    # 有効な行がないため、データベースには触れない
+    body = b"\n".join([
+        b"{not json",
+        b"",
+        json.dumps({**RECORD, "title": ""}).encode(),
+        b'{"title": "missing fields"}',
+    ])
+    result = asyncio.run(import_fixed_points(db=None, user_id=1, chunks=stream(body[:7], body[7:])))
+    
+    assert result.imported == 0
+    assert result.failed == 3
+    assert [error.line for error in result.errors] == [1, 3, 4]
+    assert result.errors[0].error.startswith("Invalid JSON")
+    assert result.errors[1].error.startswith("title:")
@@ -0,0 +1,120 @@
+"""定点一覧の発行SQL数の回帰テスト
+
+一覧は件数に関係なく一定数のSQLで取得する（定点ごとにお気に入りを検索しない）。
+1ページの取得は一覧の1文、ログイン時はお気に入り状態の取得の1文を加えた2文になる。
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from fastapi import Response
+from sqlalchemy import event, insert
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import NullPool
+
+import models  # これにより全てのモデルが登録される
+from api.fixed_points import get_fixed_points
+from core.database import get_async_database_url
+from models.favorite import Favorite
+from models.fixed_point import FixedPoint
+from models.user import AuthProvider, User
+from schemas.auth import TokenData
+from services.fixed_point_cache import fixed_point_list_cache
+
+SEED_FIXED_POINTS = 40
+
+
+async def seed(db: AsyncSession) -> int:
+    """ユーザーと定点を投入し、ユーザーIDを返す（半分の定点をお気に入りにする）"""
+    user_id = await db.scalar(
+        insert(User).returning(User.id).values(
+            username="query_count_user",
+            email="query_count_user@example.com",
+            auth_provider=AuthProvider.EMAIL
+        )
+    )
+    now = datetime.now(timezone.utc)
+    fixed_point_ids = (await db.scalars(
+        insert(FixedPoint).returning(FixedPoint.id, sort_by_parameter_order=True),
+        [
+            {
+                "user_id": user_id,
+                "title": f"query count {i}",
+                "map_id": "query-count-map",
+                "character_id": "query-count-agent",
+                "created_at": now - timedelta(minutes=i),
+            }
+            for i in range(SEED_FIXED_POINTS)
+        ]
+    )).all()
+    await db.execute(
+        insert(Favorite),
+        [{"user_id": user_id, "fixed_point_id": fixed_point_id} for fixed_point_id in fixed_point_ids[::2]]
+    )
+    return user_id
+
+
+async def count_list_statements(database_url: str) -> dict:
+    """条件ごとに get_fixed_points を呼び出し、発行したSQL数を返す（投入したデータはロールバックする）"""
+    engine = create_async_engine(get_async_database_url(database_url), poolclass=NullPool)
+    statements = []
+    
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    
+    counts = {}
+    try:
+        async with engine.connect() as conn:
+            transaction = await conn.begin()
+            db = AsyncSession(bind=conn, join_transaction_mode="create_savepoint")
+            try:
+                user_id = await seed(db)
+                claims = TokenData(user_id=user_id, username="query_count_user")
+                
+                async def list_page(limit, claims=None, favorited_by=None, cached=False):
+                    if not cached:
+                        fixed_point_list_cache.clear()
+                    statements.clear()
+                    rows = await get_fixed_points(
+                        response=Response(),
+                        character_id=None,
+                        map_id="query-count-map",
+                        user_id=None,
+                        favorited_by=favorited_by,
+                        sort="newest",
+                        cursor=None,
+                        skip=0,
+                        limit=limit,
+                        claims=claims,
+                        db=db
+                    )
+                    assert len(rows) == min(limit, SEED_FIXED_POINTS // 2 if favorited_by else SEED_FIXED_POINTS)
+                    return len(statements)
+                
+                for limit in (1, 10, 30):
+                    counts[("anonymous", limit)] = await list_page(limit)
+                    counts[("logged in", limit)] = await list_page(limit, claims=claims)
+                    counts[("favorited by", limit)] = await list_page(limit, claims=claims, favorited_by=user_id)
+                # キャッシュに載せてから同じページを取得する
+                await list_page(10)
+                counts[("anonymous cached", 10)] = await list_page(10, cached=True)
+                counts[("logged in cached", 10)] = await list_page(10, claims=claims, cached=True)
+            finally:
+                await db.close()
+                await transaction.rollback()
+    finally:
+        fixed_point_list_cache.clear()
+        await engine.dispose()
+    return counts
+
+
+def test_list_statement_count_does_not_depend_on_page_size(migrated_database):
+    counts = asyncio.run(count_list_statements(migrated_database))
+    
+    for limit in (1, 10, 30):
+        assert counts[("anonymous", limit)] == 1
+        assert counts[("logged in", limit)] == 2
+        assert counts[("favorited by", limit)] == 2
+    # キャッシュ済みのページはお気に入り状態の取得のみ
+    assert counts[("anonymous cached", 10)] == 0
+    assert counts[("logged in cached", 10)] == 1
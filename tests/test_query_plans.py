@@ -0,0 +1,25 @@
+"""主要クエリの実行計画の回帰テスト（scripts/check_query_plans.py と同じ確認）"""
+import pytest
+
+from scripts.check_query_plans import check_query_plans, find_fallbacks
+
+
+@pytest.fixture
+def query_plans(migrated_database):
+    from core.database import engine
+    
+    with engine.connect() as conn:
+        transaction = conn.begin()
+        try:
+            yield check_query_plans(conn)
+        finally:
+            transaction.rollback()
+
+
+def test_query_shapes_use_indexes(query_plans):
+    failures = {
+        name: find_fallbacks(plan)
+        for name, plan in query_plans.items()
+        if find_fallbacks(plan)
+    }
+    assert failures == {}
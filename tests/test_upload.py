@@ -0,0 +1,95 @@
+"""画像の一括アップロード（store_images）のテスト"""
+import asyncio
+import io
+
+import pytest
+from fastapi import FastAPI, HTTPException, UploadFile
+from fastapi.testclient import TestClient
+from PIL import Image
+from starlette.datastructures import Headers
+
+import api.upload as upload
+from services.image_processing import image_processing_service
+
+
+@pytest.fixture(autouse=True)
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(upload, "UPLOAD_DIR", str(tmp_path))
+    yield tmp_path
+    image_processing_service.shutdown()
+
+
+def png_bytes(color) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (32, 24), color).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def make_upload(filename: str, data: bytes, content_type: str = "image/png") -> UploadFile:
+    return UploadFile(
+        file=io.BytesIO(data),
+        filename=filename,
+        headers=Headers({"content-type": content_type})
+    )
+
+
+def test_store_images_returns_every_file_in_order(upload_dir):
+    results = asyncio.run(upload.store_images([
+        make_upload("red.png", png_bytes((255, 0, 0))),
+        make_upload("green.png", png_bytes((0, 255, 0))),
+        make_upload("blue.png", png_bytes((0, 0, 255))),
+    ]))
+    
+    assert len(results) == 3
+    assert len({result["filename"] for result in results}) == 3
+    for result in results:
+        assert result["url"] == f"{upload.UPLOAD_URL_PREFIX}{result['filename']}"
+        assert (result["width"], result["height"]) == (32, 24)
+        assert result["created"] is True
+        assert (upload_dir / result["filename"]).is_file()
+
+
+def test_store_images_rejects_the_batch_before_writing_when_a_file_type_is_not_allowed(upload_dir):
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(upload.store_images([
+            make_upload("red.png", png_bytes((255, 0, 0))),
+            make_upload("notes.txt", b"not an image", content_type="text/plain"),
+        ]))
+    
+    assert exc_info.value.status_code == 400
+    assert list(upload_dir.iterdir()) == []
+
+
+def test_store_images_fails_the_whole_batch_when_one_image_is_invalid(upload_dir):
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(upload.store_images([
+            make_upload("red.png", png_bytes((255, 0, 0))),
+            make_upload("broken.png", b"\x89PNG\r\n\x1a\n" + b"broken" * 100),
+        ]))
+    
+    assert exc_info.value.status_code == 400
+    assert exc_info.value.detail == "Invalid image file"
+    # 一時ファイルは残さない（保存済みの画像は scripts/gc_uploads.py が回収する）
+    assert [path.name for path in upload_dir.iterdir() if path.name.endswith(".part")] == []
+
+
+def test_immutable_image_is_served_without_last_modified(upload_dir):
+    app = FastAPI()
+    app.include_router(upload.router)
+    client = TestClient(app)
+    
+    [result] = asyncio.run(upload.store_images([make_upload("red.png", png_bytes((255, 0, 0)))]))
+    url = result["url"]
+    
+    response = client.get(url)
+    assert response.status_code == 200
+    assert "last-modified" not in response.headers
+    etag = response.headers["etag"]
+    
+    # 重複排除で更新日時が変わってもETagは変わらない
+    asyncio.run(upload.store_images([make_upload("red-again.png", png_bytes((255, 0, 0)))]))
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+    
+    # If-Range はETagと比較する
+    assert client.get(url, headers={"Range": "bytes=0-3", "If-Range": etag}).status_code == 206
+    assert client.get(url, headers={"Range": "bytes=0-3", "If-Range": "Thu, 01 Jan 2026 00:00:00 GMT"}).status_code == 200